@@ -0,0 +1,187 @@
+import os
+import csv
+import json
+import time
+import random
+import argparse
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Grid import _Grid
+from Instrument import instrument
+from TileCache import tile_cache
+from TileAtlas import _TileAtlas, open_atlas
+
+
+# Parameters of a job and their defaults, like the script part of Grid.py
+DEFAULTS = {
+    "seed": 1256,
+    "width": 210,
+    "height": 297,
+    "hex_size": 20,
+    "offset_x": 10,
+    "offset_y": 10,
+    "margin_width": 10,
+    "margin_height": 10,
+    "lines_per_segment": 5,
+    "hexagon_margin": 0.15,
+    "background": True,
+    "tolerance": None,
+    "tile_seed": False,
+    "colour_count": 5,
+    "mode": "greedy",
+    "draw": "one_colour,coloured",
+    "encoding": "polyline",
+    "precision": 2,
+    "compress": False,
+    "join": False,
+    "layers": False,
+    "plot_order": False,
+    "dpi": 96,
+    "output": None,
+    "instrument": False,
+}
+
+GRID_OPTIONS = ["width", "height", "hex_size", "offset_x", "offset_y", "margin_width", "margin_height", "lines_per_segment", "hexagon_margin", "background", "tolerance"]
+
+
+def parse_value(text):
+    """Value of a csv cell: bool, int, float or the text itself, empty cells are None."""
+    text = text.strip()
+    if text == "":
+        return None
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def read_jobs(filename):
+    """
+    Jobs from a JSON file (a list of jobs or {"defaults": {...}, "jobs": [...]}) or a CSV file with one job per row.
+    Missing values are taken from DEFAULTS, every job gets an output path if it has none.
+    """
+    if filename.endswith(".csv"):
+        with open(filename, newline="") as file:
+            rows = [{key: parse_value(value) for key, value in row.items()} for row in csv.DictReader(file)]
+        defaults, jobs = {}, [{key: value for key, value in row.items() if value is not None} for row in rows]
+    else:
+        with open(filename) as file:
+            data = json.load(file)
+        defaults, jobs = (data.get("defaults", {}), data["jobs"]) if isinstance(data, dict) else ({}, data)
+
+    unknown = set(defaults) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unbekannte Parameter in defaults: {sorted(unknown)}")
+
+    result = []
+    for index, job in enumerate(jobs):
+        unknown = set(job) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unbekannte Parameter in Job {index}: {sorted(unknown)}")
+        job = {**DEFAULTS, **defaults, **job}
+        if job["output"] is None:
+            job["output"] = f"render_{index:04d}"
+        result.append(job)
+    return result
+
+
+def run_job(job):
+    """Render one job in this (warm) process, returns the files and the time of the job."""
+    start = time.perf_counter()
+    directory = os.path.dirname(job["output"])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    options = dict(encoding=job["encoding"], precision=job["precision"], compress=job["compress"], join=job["join"], plot_order=job["plot_order"])
+    draws = [draw.strip() for draw in job["draw"].split(",")]
+    files = []
+    # The recording starts before the grid, so tile drawing and the template stages are part of the report
+    with instrument.recording() if job["instrument"] else nullcontext():
+        # Without tile_seed the tiles are drawn from the random module like in the script part of Grid.py
+        if job["tile_seed"]:
+            grid = _Grid(seed=job["seed"], **{key: job[key] for key in GRID_OPTIONS})
+        else:
+            random.seed(job["seed"])
+            grid = _Grid(**{key: job[key] for key in GRID_OPTIONS})
+
+        if "one_colour" in draws:
+            files.append(grid.draw_grid_one_colour(name=job["output"] + "_one_colour", **options))
+        if "coloured" in draws:
+            files.extend(grid.draw_grid_coloured(name=job["output"] + "_coloured", layers=job["layers"], colour_count=job["colour_count"], mode=job["mode"], **options))
+        if "preview" in draws:
+            files.append(grid.draw_preview(name=job["output"] + "_preview", dpi=job["dpi"]))
+        if "preview_coloured" in draws:
+            files.append(grid.draw_preview(coloured=True, name=job["output"] + "_preview_coloured", dpi=job["dpi"], colour_count=job["colour_count"], mode=job["mode"]))
+
+    result = {
+        "output": job["output"],
+        "pid": os.getpid(),
+        "time": time.perf_counter() - start,
+        "hexagons": len(grid.grid),
+        "files": files,
+        "bytes": sum(os.path.getsize(file) for file in files),
+    }
+    if job["instrument"]:
+        result["report"] = instrument.report()
+    if job["plot_order"]:
+        result["plot_report"] = grid.format_plot_report()
+    return result
+
+
+def prepare_atlases(jobs, directory):
+    """Build (or check) the tile atlas of every configuration used by the jobs in directory, returns their files."""
+    configs = dict.fromkeys((job["hex_size"], job["lines_per_segment"], job["hexagon_margin"], job["tolerance"]) for job in jobs)
+    return [open_atlas(directory, *config).filename for config in configs]
+
+
+def attach_atlases(filenames):
+    """Memory map the atlases and take the tile templates from them, run once in every worker."""
+    for filename in filenames:
+        tile_cache.attach(_TileAtlas(filename))
+
+
+def run_jobs(jobs, workers=None, atlases=()):
+    """
+    Run the jobs on a pool of workers processes, the processes stay alive for all jobs
+    so the imports and the tile cache are reused. Yields (index, result) as the jobs finish.
+    atlases are tile atlas files every worker maps at start, so no worker builds tile geometry.
+    """
+    if workers == 1:
+        attach_atlases(atlases)
+        for index, job in enumerate(jobs):
+            yield index, run_job(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=attach_atlases, initargs=(list(atlases),)) as executor:
+        futures = {executor.submit(run_job, job): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render many grids from a JSON or CSV job list.")
+    parser.add_argument("jobs", help="JSON or CSV file with the jobs")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cpus)")
+    parser.add_argument("--report", default=None, help="write the results of all jobs as JSON")
+    parser.add_argument("--atlas", default=None, help="directory of the tile atlas files, built if missing")
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.jobs)
+    results = [None] * len(jobs)
+    start = time.perf_counter()
+    atlases = prepare_atlases(jobs, args.atlas) if args.atlas else ()
+    for index, result in run_jobs(jobs, args.workers, atlases):
+        results[index] = result
+        print(f"[{index + 1}/{len(jobs)}] {result['output']}: {result['time']:.2f} s, "
+              f"{result['hexagons'] / result['time']:.0f} Hexagone/s, {len(result['files'])} Dateien, {result['bytes'] / 1e3:.0f} kB")
+        if "plot_report" in result:
+            print(result["plot_report"])
+    total = time.perf_counter() - start
+    print(f"{len(jobs)} Jobs in {total:.1f} s, {len(jobs) / total * 60:.1f} Jobs/min")
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump({"total_time": total, "jobs": results}, file, indent=1)
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import itertools
+import numpy as np
+import shapely
+from Grid import _Grid, COLORS
+from Colouring import _Colouring
+from TileCache import tile_cache, _TileTemplate
+from SvgWriter import _SvgWriter
+
+
+PAGES = {"A4": (210, 297), "A3": (297, 420)}
+
+# Default case and the values every parameter is swept over
+BASE = {"page": "A4", "hex_size": 20, "lines_per_segment": 5, "colour_count": 5}
+SWEEP = {"page": ["A4", "A3"], "hex_size": [10, 20, 30], "lines_per_segment": [3, 5, 8], "colour_count": [3, 5]}
+
+
+def cases(full=False):
+    """Parameter sets of the benchmark: every parameter changed alone from BASE, or with full all combinations."""
+    if full:
+        keys = list(SWEEP)
+        return [dict(zip(keys, values)) for values in itertools.product(*SWEEP.values())]
+    result = [dict(BASE)]
+    for key, values in SWEEP.items():
+        for value in values:
+            if value != BASE[key]:
+                result.append(dict(BASE, **{key: value}))
+    return result
+
+
+def case_name(case):
+    return "{page}_hex{hex_size}_lines{lines_per_segment}_colours{colour_count}".format(**case)
+
+
+def fingerprint(lines_by_colour):
+    """Hash of the clipped lines (rounded to 1e-6) and their colours, equal output gives an equal hash."""
+    digest = hashlib.sha256()
+    for colour in sorted(lines_by_colour):
+        digest.update(f"colour {colour}\n".encode())
+        for line in lines_by_colour[colour]:
+            digest.update(np.round(np.asarray(line, dtype=float), 6).tobytes())
+    return digest.hexdigest()
+
+
+class _Benchmark():
+    def __init__(self, case, seed=1256, repeat=3):
+        """
+        Run the stages of the pipeline for one parameter set.
+        Every stage is timed repeat times (the fastest run counts), then once more with tracemalloc for its peak memory.
+        """
+        self.case = case
+        self.seed = seed
+        self.repeat = repeat
+        self.width, self.height = PAGES[case["page"]]
+        self.stages = {}
+        self.counts = {}
+
+    def grid(self):
+        return _Grid(self.width, self.height, self.case["hex_size"], offset_y=10, hexagon_margin=0.15,
+                     lines_per_segment=self.case["lines_per_segment"], seed=self.seed)
+
+    def measure(self, name, stage, setup=None):
+        """Time stage() and record its peak memory, setup() is run before every call and not measured."""
+        times = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = stage()
+            times.append(time.perf_counter() - start)
+
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stages[name] = {"time": min(times), "peak_memory": peak}
+        return result
+
+    def run(self):
+        grid = self.grid()
+        connections = {tuple(map(tuple, hexagon.connection)) for hexagon in grid.grid}
+
+        # Curve generation of the segments: every tile variant of the grid drawn around the origin
+        self.measure("segments", lambda: [_TileTemplate([list(pair) for pair in connection], self.case["hex_size"], self.case["lines_per_segment"], 0.15)
+                                          for connection in connections])
+        # Hexagons from a cold and a warm tile cache
+        self.measure("grid_cold", self.grid, setup=tile_cache.clear)
+        grid = self.measure("grid_warm", self.grid)
+
+        colouring = self.measure("grouping", lambda: _Colouring(grid.grid, mode=None))
+        colouring = self.measure("colouring", lambda: _Colouring(grid.grid, colour_count=self.case["colour_count"]))
+
+        lines_by_colour = self.measure("clipping", grid.clip_by_colour)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "benchmark.svg")
+            self.measure("export", lambda: self.export(filename, lines_by_colour))
+            svg_bytes = os.path.getsize(filename)
+
+        lines = [line for colour_lines in lines_by_colour.values() for line in colour_lines]
+        self.counts = {
+            "hexagons": len(grid.grid),
+            "segments": sum(len(hexagon.segments) for hexagon in grid.grid),
+            "strands": len(colouring.segment_group_list),
+            "colours": len(lines_by_colour),
+            "elements": len(lines),
+            "vertices": sum(len(line) for line in lines),
+            "svg_bytes": svg_bytes,
+        }
+        return {"case": self.case, "stages": self.stages, "counts": self.counts, "fingerprint": fingerprint(lines_by_colour)}
+
+    def export(self, filename, lines_by_colour):
+        with _SvgWriter(filename, self.width, self.height) as svg:
+            for colour in sorted(lines_by_colour):
+                svg.write_lines(lines_by_colour[colour], stroke=COLORS[colour] if colour < len(COLORS) else 'black', stroke_width=0.5)
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "shapely": shapely.__version__, "machine": platform.machine()}
+
+
+def compare(results, baseline):
+    """Print the change of every stage against the baseline, returns False if a fingerprint differs."""
+    same = True
+    for name, result in results.items():
+        old = baseline["cases"].get(name)
+        if old is None:
+            print(f"{name}: nicht in der Baseline")
+            continue
+        if result["fingerprint"] != old["fingerprint"]:
+            same = False
+            print(f"{name}: FINGERPRINT GEÄNDERT")
+        else:
+            print(f"{name}: gleiche Geometrie")
+        for stage, values in result["stages"].items():
+            old_values = old["stages"].get(stage)
+            if old_values is None:
+                continue
+            print(f"  {stage:10s} {old_values['time'] * 1000:9.1f} ms -> {values['time'] * 1000:9.1f} ms ({values['time'] / old_values['time']:5.2f}x)"
+                  f"  {old_values['peak_memory'] / 1e6:7.1f} MB -> {values['peak_memory'] / 1e6:7.1f} MB")
+        for count, value in result["counts"].items():
+            if old["counts"].get(count) != value:
+                print(f"  {count}: {old['counts'].get(count)} -> {value}")
+    return same
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of grid generation, colouring and svg export.")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="JSON file with the results of an earlier run")
+    parser.add_argument("--save", action="store_true", help="write the results as new baseline")
+    parser.add_argument("--full", action="store_true", help="all combinations of the swept parameters")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1256)
+    args = parser.parse_args()
+
+    results = {}
+    for case in cases(args.full):
+        name = case_name(case)
+        results[name] = _Benchmark(case, seed=args.seed, repeat=args.repeat).run()
+        total = sum(stage["time"] for stage in results[name]["stages"].values())
+        print(f"{name}: {total * 1000:.0f} ms, {results[name]['counts']['elements']} Linien, {results[name]['counts']['vertices']} Punkte")
+
+    same = True
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as file:
+            same = compare(results, json.load(file))
+    else:
+        with open(args.baseline, "w") as file:
+            json.dump({"environment": environment(), "seed": args.seed, "cases": results}, file, indent=1)
+        print(f"Baseline gespeichert: {args.baseline}")
+
+    sys.exit(0 if same else 1)
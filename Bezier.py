@@ -0,0 +1,46 @@
+import numpy as np
+import shapely
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def bernstein_basis(num=90):
+    """Quadratic Bernstein basis sampled at num points, shape (num, 3)."""
+    t = np.linspace(0, 1, num)
+    basis = np.stack([(1 - t)**2, 2 * (1 - t) * t, t**2], axis=1)
+    basis.flags.writeable = False
+    return basis
+
+
+def locate(controls, points, num=90):
+    """
+    Curve parameter t of points lying on (or within the sampling error of) the quadratic bezier with the (3, 2) controls.
+    The points are projected on the curve sampled with num points, the distance along it is mapped back to t.
+    """
+    samples = bernstein_basis(num) @ controls
+    distance = shapely.line_locate_point(shapely.linestrings(samples), shapely.points(np.asarray(points, dtype=float)))
+    length = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(samples, axis=0), axis=1))])
+    return np.interp(distance, length, np.linspace(0, 1, num))
+
+
+def sub_curve(controls, t0, t1):
+    """Control points of the part [t0, t1] of a quadratic bezier, the middle one is the blossom of (t0, t1)."""
+    p0, p1, p2 = controls
+    start = (1 - t0)**2 * p0 + 2 * (1 - t0) * t0 * p1 + t0**2 * p2
+    end = (1 - t1)**2 * p0 + 2 * (1 - t1) * t1 * p1 + t1**2 * p2
+    middle = (1 - t0) * (1 - t1) * p0 + ((1 - t0) * t1 + t0 * (1 - t1)) * p1 + t0 * t1 * p2
+    return np.array([start, middle, end])
+
+
+def piece_curves(controls, pieces, index):
+    """
+    Exact sub curve of every clipped piece, index gives the curve of controls each piece was cut from.
+    The ends are taken from the piece, so curves of pieces that meet still meet after the clipping.
+    """
+    curves = []
+    for piece, k in zip(pieces, index):
+        t0, t1 = locate(controls[k], [piece[0], piece[-1]])
+        curve = sub_curve(controls[k], t0, t1)
+        curve[0], curve[2] = piece[0], piece[-1]
+        curves.append(curve)
+    return curves
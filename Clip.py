@@ -0,0 +1,112 @@
+import numpy as np
+import shapely
+from Instrument import instrument
+
+
+def to_linestrings(lines):
+    """Build an array of LineStrings from a (lines, n, 2) array or a list of (n, 2) arrays."""
+    if isinstance(lines, np.ndarray) and lines.ndim == 3:
+        return shapely.linestrings(lines)
+    if len(lines) == 0:
+        return np.empty(0, dtype=object)
+    lines = [np.asarray(line, dtype=float) for line in lines]
+    coords = np.concatenate(lines)
+    indices = np.repeat(np.arange(len(lines)), [len(line) for line in lines])
+    return shapely.linestrings(coords, indices=indices)
+
+
+def split_parts(parts):
+    """Coordinates of each LineString of an array as a list of (n, 2) arrays."""
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+    bounds = np.flatnonzero(np.diff(index)) + 1
+    return np.split(coords, bounds) if len(coords) else []
+
+
+def clip_lines(lines, area, return_index=False, simplify=None):
+    """
+    Clip all lines against a shapely area with the vectorized shapely 2 functions.
+    Lines completely inside the area are kept as they are, only the others go through intersection.
+    With simplify the clipped lines are reduced with Douglas-Peucker to that tolerance.
+    Returns the clipped pieces as a list of (n, 2) arrays and, if asked, the index of the source line of each piece.
+    """
+    with instrument.stage("shapely_clip"):
+        geoms = to_linestrings(lines)
+        if len(geoms) == 0:
+            return ([], np.empty(0, dtype=int)) if return_index else []
+
+        shapely.prepare(area)
+        inside = shapely.contains_properly(area, geoms)
+        instrument.count("shapely_calls")
+        crossing = ~inside & shapely.intersects(area, geoms)
+        instrument.count("shapely_calls")
+
+        clipped = np.empty(len(geoms), dtype=object)
+        clipped[inside] = geoms[inside]
+        if crossing.any():
+            clipped[crossing] = shapely.intersection(geoms[crossing], area)
+            instrument.count("shapely_calls")
+        keep = inside | crossing
+        if simplify and keep.any():
+            clipped[keep] = shapely.simplify(clipped[keep], simplify, preserve_topology=False)
+            instrument.count("shapely_calls")
+        instrument.count("shapely_intersections", int(crossing.sum()))
+
+        return _line_pieces(clipped[keep], np.flatnonzero(keep), return_index)
+
+
+def clip_lines_to_rect(lines, min_x, min_y, max_x, max_y, return_index=False):
+    """
+    Clip all lines against an axis aligned rectangle (boundary included) with a vectorized Liang-Barsky clipper.
+    Cheaper than a general shapely intersection, used for the page margin.
+    """
+    if len(lines) == 0:
+        return ([], np.empty(0, dtype=int)) if return_index else []
+
+    lines = [np.asarray(line, dtype=float) for line in lines]
+    counts = np.array([len(line) for line in lines])
+    coords = np.concatenate(lines)
+    line_of_point = np.repeat(np.arange(len(lines)), counts)
+
+    # Every pair of consecutive points of the same line is one segment
+    same_line = line_of_point[1:] == line_of_point[:-1]
+    start = coords[:-1][same_line]
+    delta = coords[1:][same_line] - start
+    line_of_segment = line_of_point[:-1][same_line]
+
+    # Liang-Barsky: parameter range [t0, t1] of every segment inside the rectangle
+    t0 = np.zeros(len(start))
+    t1 = np.ones(len(start))
+    rejected = np.zeros(len(start), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in ((-delta[:, 0], start[:, 0] - min_x), (delta[:, 0], max_x - start[:, 0]),
+                     (-delta[:, 1], start[:, 1] - min_y), (delta[:, 1], max_y - start[:, 1])):
+            ratio = q / p
+            t0 = np.where(p < 0, np.maximum(t0, ratio), t0)
+            t1 = np.where(p > 0, np.minimum(t1, ratio), t1)
+            rejected |= (p == 0) & (q < 0)
+    kept = ~rejected & (t0 < t1)
+
+    # A new piece starts wherever the previous segment is not kept completely up to this one
+    continues = np.zeros(len(start), dtype=bool)
+    continues[1:] = (kept[1:] & kept[:-1] & (line_of_segment[1:] == line_of_segment[:-1])
+                     & (t1[:-1] == 1) & (t0[1:] == 0))
+    kept_index = np.flatnonzero(kept)
+    piece_start = kept_index[~continues[kept_index]]
+    piece_end = kept_index[~np.append(continues[1:], False)[kept_index]]
+
+    first = start + t0[:, None] * delta
+    last = start + t1[:, None] * delta
+    pieces = [np.vstack([first[begin], last[begin:end + 1]]) for begin, end in zip(piece_start, piece_end)]
+    index = line_of_segment[piece_start]
+    return (pieces, index) if return_index else pieces
+
+
+def _line_pieces(clipped, source, return_index):
+    """Split multi part results and drop everything that is not a line (e.g. touching points)."""
+    parts, index = shapely.get_parts(clipped, return_index=True)
+    index = source[index]
+    is_line = (shapely.get_type_id(parts) == 1) & ~shapely.is_empty(parts)
+    parts, index = parts[is_line], index[is_line]
+
+    pieces = split_parts(parts)
+    return (pieces, index) if return_index else pieces
@@ -3,130 +3,164 @@ import svgwrite
 from shapely.geometry import Polygon, LineString, LinearRing
 import numpy as np
 import random
+from collections import Counter
 from Hexagon import _Hexagon
 from Segment import _Segment
 from Group import _Group
+from DisjointSet import _DisjointSet
+from Neighbours import neighbour_edge
+from StrandGraph import _StrandGraph, merge_smallest_overlap
+from Instrument import instrument
 
 class _Colouring():
-    def __init__(self, grid, colour_count=5):
-        
+    def __init__(self, grid, colour_count=5, mode="greedy"):
+        """
+        Group the segments of the grid into strands and colour them with colour_count colours.
+        mode "greedy" places each strand in the first colour group without a common hexagon,
+        mode "dsatur" colours the conflict graph of the strands with the DSatur heuristic,
+        with mode None the segments are only grouped into strands.
+        """
         self.grid = grid
+        self.mode = mode
         self.segment_group_list = []  # List to hold open group
 
         self.group_id = 0  # Initialize group ID
 
-        # Iterate through grid and create segments
-        for hexagon in self.grid: 
-            for segment in hexagon.segments:
-
-                place_found = False
-                # Iterate through existing groups to find a place for the new segment
-                for group in self.segment_group_list:
-                    # Check if the segment can be added to an existing group
-                    result, old_end = group.test_segment(segment)
-                    if result:
-                        # If it connects to an open segment, add it to the group
-                        # Add the segment to the existing group
-                        group.add_segment(segment, old_end)
-                        place_found = True
-                        break    
-
-                # Create a new group if no open group is found
-                if not place_found:
-                    new_group = _Group(self.group_id, segment)
-                    self.segment_group_list.append(new_group)
-                    self.group_id += 1
-
-
-        self.merge_groups()
-        self.groups_colouring()
+        with instrument.stage("grouping"):
+            self.group_segments()
+        instrument.set("strands", len(self.segment_group_list))
+        if self.mode is None:
+            return
+        with instrument.stage("colouring"):
+            if self.mode == "greedy":
+                self.groups_colouring()
+            elif self.mode == "dsatur":
+                self.groups_colouring_dsatur()
+            else:
+                raise ValueError("Ungültiger Wert!")
         
         # Merge the colour groups until colour_count is reached
-        while len(self.coloured_groups) > colour_count:
-            self.merge_colour_groups_with_smallest_intersection() 
-        self.assign_colour_group()
-
-
-    def merge_groups(self):
-        """Check if groups from self.segment_group_list can be merged based on open ends. Repeatedly merge groups until no more merges are possible. Each Group with each group per iteration."""
-        merged = True
-        x = 0  # Counter for iterations
-
-        while merged:
-            
-            #count the number of iterations
-            x += 1
-
-            unchecked_groups = self.segment_group_list  # Copy of the current segment group list
-            checked_groups = []  # List to hold groups that have been checked
-            new_segment_group_list = []
-
-            merged = False  # Reset merged flag for this iteration
-
-            for group in unchecked_groups:
-                group_used = False
-                if group not in checked_groups:
-                    # Check if the group can be merged with any other group
-                    for other_group in unchecked_groups:
-                        if group != other_group and other_group not in checked_groups and group not in checked_groups:
-                            merge, connecting_end_g1, connecting_end_g2 = self.test_merge(group, other_group)
-                            if merge:
-                                # Merge groups
-                                group.add_group(other_group, connecting_end_g1, connecting_end_g2)
-                                new_segment_group_list.append(group)
-
-
-                                checked_groups.append(other_group)
-                                checked_groups.append(group)
-                                merged = True
-                                group_used = True
-                                break  # Exit inner loop if a merge is found
-
-                    if not group_used:
-                        # If the group was not merged, add it to the new segment group list
-                        new_segment_group_list.append(group)
-                        checked_groups.append(group)                
-    
-
-            self.segment_group_list = new_segment_group_list
-
+        instrument.set("groups_before_merge", len(self.coloured_groups))
+        with instrument.stage("colour_merge"):
+            self.merge_colour_groups(colour_count)
+            self.assign_colour_group()
+        instrument.set("groups_after_merge", len(self.coloured_groups))
+
+
+    def group_segments(self):
+        """Group the segments into connected strands with an edge index and a union-find in one linear pass."""
+        segments = [segment for hexagon in self.grid for segment in hexagon.segments]
+        self.open_edges = []  # (id_x, id_y, edge, segment) of every end without a neighbour
+        self.group_of = {}  # Strand group of each segment
+        self.segment_group_list = self.build_groups(segments)
+
+    def build_groups(self, segments):
+        """
+        Strand groups of the segments, in the order the strands first appear in segments.
+        Neighbours outside of segments are not looked at, open_edges and group_of are extended.
+        """
+        # Index both ends of every segment by (id_x, id_y, edge)
+        edge_index = {}
+        for position, segment in enumerate(segments):
+            for edge in segment.connection:
+                edge_index[(segment.id_x, segment.id_y, edge)] = position
+
+        # Join the two segments on both sides of every shared edge
+        strands = _DisjointSet(len(segments))
+        open_ends = set()
+        for (id_x, id_y, edge), position in edge_index.items():
+            other = edge_index.get(neighbour_edge(id_x, id_y, edge))
+            if other is None:
+                open_ends.add(position)
+                self.open_edges.append((id_x, id_y, edge, segments[position]))
+            else:
+                strands.union(position, other)
+
+        # One group per strand
+        groups = {}
+        for position, segment in enumerate(segments):
+            root = strands.find(position)
+            group = groups.get(root)
+            if group is None:
+                group = _Group(self.group_id, segment)
+                group.border_segments.clear()
+                groups[root] = group
+                self.group_id += 1
+            else:
+                group.add_segment_to_group([segment])
+            if position in open_ends:
+                group.border_segments.add(segment)
+            self.group_of[segment] = group
+        return list(groups.values())
+
+    def update_strands(self, segments):
+        """
+        Group the strands through segments again after the tile of their hexagon changed.
+        Only the strands that went through the segments can change: every neighbour of their new ends
+        was connected to the old tile of the hexagon, so it belongs to one of these strands.
+        Returns the old and the new strand groups.
+        """
+        old_groups = list(dict.fromkeys(self.group_of[segment] for segment in segments))
+        affected = {segment for group in old_groups for segment in group.segments}
+        self.open_edges = [entry for entry in self.open_edges if entry[3] not in affected]
+        new_groups = self.build_groups(sorted(affected, key=lambda segment: (segment.hexagon, segment.position)))
+
+        removed = set(map(id, old_groups))
+        self.segment_group_list = [group for group in self.segment_group_list if id(group) not in removed] + new_groups
+        return old_groups, new_groups
+
+    def recolour(self, groups):
+        """
+        Colour the strand groups again, the colours of all other strands stay.
+        Every group takes the colour with the fewest segments in its hexagons, on a tie the colour most of its segments had.
+        Returns the segments whose colour changed.
+        """
+        segments = [segment for group in groups for segment in group.segments]
+        old_colour = {segment: segment.colour_group for segment in segments}
+        for colour, colour_group in enumerate(self.coloured_groups):
+            colour_group.remove_segments([segment for segment in segments if old_colour[segment] == colour])
+
+        changed = []
+        for group in sorted(groups, key=lambda group: -len(group.segments)):
+            votes = Counter(old_colour[segment] for segment in group.segments)
+            colour = min(range(len(self.coloured_groups)),
+                         key=lambda colour: (group.calculate_intersection(self.coloured_groups[colour]), -votes[colour], colour))
+            self.coloured_groups[colour].add_segment_to_group(group.segments)
+            for segment in group.segments:
+                segment.colour_group = colour
+                if old_colour[segment] != colour:
+                    changed.append(segment)
+        return changed
 
     
     def groups_colouring(self):
         """Give each group a colour such that no groups with a common segment id have the same colour."""
-        # Create a list for each Colour with groups
-        self.coloured_groups = []
+        # The first colour group without a common hexagon takes the group, otherwise a new one is created
+        self.coloured_groups_from_classes(self.strand_graph().greedy_classes())
 
-        copy_segment_group_list = self.segment_group_list  # Copy of the current segment group list
-
-        for group in copy_segment_group_list:
-            placed = False  # Flag to check if the group is placed in a colour group
-
-            for colour_group in self.coloured_groups:
-                
-                overlap_found = False  # Flag to check if there is an overlap with the colour group
-                
-                # Check if the group can be added to the colour group
-                for segment in group.segments:
-                    for colour_segment in colour_group.segments:
-                        if segment.id == colour_segment.id:
-                            overlap_found = True
-                            break
-                    if overlap_found:
-                        break
-
-
-                if not overlap_found:
-                    colour_group.add_segment_to_group(group.segments)
-                    placed = True
-                    break  # Keine weitere Farbgruppe testen
-
-            if not placed:
-                # If no colour group is found, create a new one
-                self.coloured_groups.append(group)
-        
-        # Return len(coloured_groups) to indicate the number of colour groups
-        #print(f"Total Colour Groups: {len(self.coloured_groups)}")
+    def strand_graph(self):
+        """Conflict graph of the strand groups, two strands are connected if they share a hexagon."""
+        return _StrandGraph.from_hexagon_ids([group.hexagon_ids for group in self.segment_group_list])
+
+    def groups_colouring_dsatur(self):
+        """Colour the conflict graph of the strand groups with the DSatur heuristic."""
+        self.coloured_groups_from_classes(self.strand_graph().dsatur_classes())
+
+    def coloured_groups_from_classes(self, classes):
+        """Create one colour group per class of strand group positions."""
+        self.coloured_groups = []
+        for strands in classes:
+            colour_group = self.new_colour_group(self.segment_group_list[strands[0]])
+            for strand in strands[1:]:
+                colour_group.add_segment_to_group(self.segment_group_list[strand].segments)
+
+    def new_colour_group(self, group):
+        """Start a new colour group with the segments of a strand group, the strand group itself is not changed."""
+        segments = iter(group.segments)
+        colour_group = _Group(len(self.coloured_groups), next(segments))
+        colour_group.add_segment_to_group(segments)
+        self.coloured_groups.append(colour_group)
+        return colour_group
 
     def assign_colour_group(self):
         """Assign colour_group to each segment in the coloured groups."""
@@ -136,40 +170,29 @@ class _Colouring():
                 segment.colour_group = self.coloured_groups.index(colour_group)
 
     
-    def test_merge(self, group1, group2):
-        """Check if two groups can be merged based on their open ends."""
-        for border_group2 in group2.border_segments:
-            
-                # Check if the open ends are compatible for merging
-            result, border = group1.test_segment(border_group2)
-            if result:
-                # If they can be merged, return True and the connecting segments
-                return True, border, border_group2
-
-
-
-        return False, False, False
+    def merge_colour_groups(self, colour_count):
+        """
+        Merge the two colour groups with the smallest intersection until colour_count is reached.
+        The intersections are kept in a matrix, after a merge only the row and column of the merged group change.
+        """
+        count = len(self.coloured_groups)
+        overlap = np.full((count, count), np.inf)
+        for a in range(count):
+            for b in range(a + 1, count):
+                overlap[a, b] = overlap[b, a] = self.coloured_groups[a].calculate_intersection(self.coloured_groups[b])
+
+        def merge(a, b):
+            self.coloured_groups[a].add_segment_to_group(self.coloured_groups[b].segments)
+            del self.coloured_groups[b]
+
+        merge_smallest_overlap(overlap, colour_count, merge)
 
     def merge_colour_groups_with_smallest_intersection(self):
         """Merge the two colour groups with the smallest intersection."""
         if len(self.coloured_groups) < 2:
             print("Not enough colour groups to merge.")
             return
-
-        smallest_intersection = 10000000
-        # Search for the two colour groups with the smallest intersection
-        for group in self.coloured_groups:
-            for other_group in self.coloured_groups:
-                if group != other_group:
-                    intersection = group.calculate_intersection(other_group)
-                    if  intersection < smallest_intersection:
-                        # If an intersection is found, merge the two groups
-                        smallest_intersection = intersection
-                        smallest_group = group
-                        second_smallest_group = other_group
-        # Merge the two smallest groups
-        smallest_group.add_segment_to_group(second_smallest_group.segments)
-        self.coloured_groups.remove(second_smallest_group)
+        self.merge_colour_groups(len(self.coloured_groups) - 1)
 
     
 
@@ -0,0 +1,34 @@
+class _DisjointSet():
+    def __init__(self, size=0):
+        """Union-find over the elements 0 .. size-1 with union by size and path halving."""
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def add(self):
+        """Add a new single element set and return its element."""
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, element):
+        """Return the root element of the set containing element."""
+        parent = self.parent
+        while parent[element] != element:
+            parent[element] = parent[parent[element]]
+            element = parent[element]
+        return element
+
+    def union(self, a, b):
+        """Join the sets of a and b and return the new root."""
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def __len__(self):
+        return len(self.parent)
@@ -3,16 +3,45 @@ import svgwrite
 from shapely.geometry import Polygon, LineString, LinearRing
 import numpy as np
 import random
-from Hexagon import _Hexagon
+from concurrent.futures import ThreadPoolExecutor
+from Hexagon import _Hexagon, _HexagonList
+from HexagonArrays import _HexagonArrays
 from Colouring import _Colouring
+from Clip import clip_lines_to_rect
+from Bezier import piece_curves
+from StrandJoin import join_strands
+from PlotOrder import _PlotOrder
+from Instrument import instrument
+from SvgWriter import _SvgWriter, polyline_element
+from RasterWriter import _RasterWriter
+
+
+COLORS = ['seagreen', 'red', 'skyblue', 'white', 'purple',
+'orange', 'cyan', 'magenta', 'brown', 'gray', 'black']
+
+# Position of a hexagon relative to the draw area
+INSIDE = 0
+BORDER = 1
+OUTSIDE = 2
 
 
 class _Grid():
 
-    def __init__(self, width, height, hex_size, offset_x = 10, offset_y = 0, lines_per_segment = 5, background=True, margin_width=10, margin_height=10, hexagon_margin=0.2):
+    def __init__(self, width, height, hex_size, offset_x = 10, offset_y = 0, lines_per_segment = 5, background=True, margin_width=10, margin_height=10, hexagon_margin=0.2, seed=None, region=None, tolerance=None, streaming=False):
         """
         Initialize a grid with the given parameters.
+        Without seed the tiles are drawn one after another from the random module.
+        With seed every hexagon gets its own generator derived from (seed, id_x, id_y), so the tiles of any part
+        of the grid do not depend on the rest, which lets TiledRender generate its tiles in parallel processes.
+        region (id_x_start, id_x_stop, id_y_start, id_y_stop) only generates the hexagons with ids in that range,
+        it needs a seed so the tiles do not depend on the rest of the grid.
+        tolerance is the allowed deviation of the drawn lines from the exact curves in output units (mm),
+        without it every curve is sampled with a fixed number of points.
+        With streaming no hexagons are generated, they are generated band by band by iter_bands (see Streaming.py).
         """
+        if region is not None and seed is None:
+            raise ValueError("A region of the grid needs a seed")
+
         self.width = width
         self.height = height
         self.offset_x = offset_x
@@ -23,6 +52,9 @@ class _Grid():
         self.margin_width = margin_width
         self.margin_height = margin_height
         self.hexagon_margin = hexagon_margin
+        self.seed = seed
+        self.region = region
+        self.tolerance = tolerance
 
         # hex_r_x horizontal length and hex_r_y the vertical
         self.hex_r_y = hex_size * math.sqrt(3) / 2
@@ -30,6 +62,10 @@ class _Grid():
 
         #collection of all hexagon obj
         self.grid = []
+        self.hexagons = None
+        self.index_of = None  # (id_x, id_y) -> number of the hexagon, built by replace_tile
+        self.colouring = None  # Colouring of the last coloured drawing, changed by replace_tile
+        self.plot_report = {}  # Stats of the last order_for_plotter
 
         # Draw Area with margin
         self.draw_area = Polygon([(self.margin_width, self.margin_height ), 
@@ -38,7 +74,22 @@ class _Grid():
                           - self.margin_height ), 
                          (self.margin_width, self.height
                           - self.margin_height )]) 
+        self.draw_rect = (self.margin_width, self.margin_height, self.width - self.margin_width, self.height - self.margin_height)
 
+        if streaming:
+            # The hexagons are generated band by band by iter_bands
+            return
+
+        positions = [position for row in self.iter_rows() for position in row]
+        self.hexagons = self.build_hexagons(positions)
+        self.grid = _HexagonList(self.hexagons)
+        instrument.count("hexagons", len(self.grid))
+
+    def iter_rows(self):
+        """
+        Generator over the rows of the grid, every row as list of (j, i, id, page_class, tile) of its hexagons
+        in the draw area and the region. Without seed the tiles are drawn while the rows are generated, otherwise tile is None.
+        """
         #generation of the hexagon center
         #full cover of the width and height
         row_index = 0
@@ -46,44 +97,266 @@ class _Grid():
             
             x_offset = 0 if row_index % 2 == 0 else 1.5 * self.hex_r_x
 
+            row = []
             for j in np.arange(0 - self.offset_x + x_offset, self.width + self.hex_r_x, 3 * self.hex_r_x):
                 id = [round((j + self.offset_x - x_offset) / (3 * self.hex_r_x)),round((i + self.offset_y) / self.hex_r_y),]
-                hex = _Hexagon(j, i, self.hex_size,id, lines_per_segment=self.lines_per_segment, margin=self.hexagon_margin)
-                self.grid.append(hex)
 
+                # Without seed the tiles are drawn in grid order, hexagons outside of the draw area are not
+                # generated but use up their random tile so the drawing for a seed stays the same
+                tile = _Hexagon.choose_tile() if self.seed is None else None
+                page_class = self.classify(_Hexagon.bounds_at(j, i, self.hex_size))
+                if page_class == OUTSIDE or not self.in_region(id):
+                    continue
+                row.append((j, i, id, page_class, tile))
 
+            yield row
             row_index += 1
 
+    def build_hexagons(self, positions):
+        """_HexagonArrays of the positions from iter_rows, the tiles are drawn first if the grid has a seed."""
+        if self.seed is not None:
+            with instrument.stage("tile_drawing"):
+                tiles = self.draw_tiles([id for _, _, id, _, _ in positions])
+            positions = [(j, i, id, page_class, tile) for (j, i, id, page_class, _), tile in zip(positions, tiles)]
+
+        # The hexagons are kept as arrays, self.grid gives views on them
+        with instrument.stage("hexagons"):
+            hexagons = _HexagonArrays(self.hex_size, self.lines_per_segment, self.hexagon_margin, self.tolerance, capacity=len(positions))
+            for j, i, id, page_class, tile in positions:
+                hexagons.append(j, i, id, tile, on_border=page_class == BORDER)
+        return hexagons
+
+    def iter_bands(self, band_rows=8):
+        """
+        Generator over the hexagons in bands of band_rows rows, every band as _HexagonList on its own arrays.
+        Only the band that is handed out is kept, so the memory depends on the width of the canvas and not on its area.
+        Without seed the tiles are drawn while iterating, so the bands of a second iteration have other tiles.
+        """
+        band = []
+        for row_number, row in enumerate(self.iter_rows()):
+            band.extend(row)
+            if (row_number + 1) % band_rows == 0 and band:
+                yield _HexagonList(self.build_hexagons(band))
+                band = []
+        if band:
+            yield _HexagonList(self.build_hexagons(band))
+
+    def draw_tiles(self, ids):
+        """Tiles of the hexagon ids from their own generators."""
+        return [_Hexagon.choose_tile(rng=_Hexagon.tile_random(self.seed, id_x, id_y)) for id_x, id_y in ids]
+
+    def in_region(self, id):
+        """Check if a hexagon id is part of the generated region."""
+        if self.region is None:
+            return True
+        id_x_start, id_x_stop, id_y_start, id_y_stop = self.region
+        return id_x_start <= id[0] < id_x_stop and id_y_start <= id[1] < id_y_stop
+
+    def classify(self, bounds):
+        """Position of a bounding box relative to the draw area: INSIDE, BORDER or OUTSIDE."""
+        min_x, min_y, max_x, max_y = bounds
+        rect_min_x, rect_min_y, rect_max_x, rect_max_y = self.draw_rect
+        if max_x <= rect_min_x or min_x >= rect_max_x or max_y <= rect_min_y or min_y >= rect_max_y:
+            return OUTSIDE
+        if min_x >= rect_min_x and max_x <= rect_max_x and min_y >= rect_min_y and max_y <= rect_max_y:
+            return INSIDE
+        return BORDER
+
+    def clip_segments(self, colour=None, hexagons=None, curves=False, return_index=False):
+        """
+        Lines of all segments (or only of one colour group) clipped to the draw area, as list of (segment, pieces).
+        Lines of inside hexagons are passed through, only border hexagons are clipped by the rectangle.
+        With curves the pieces are the (3, 2) control points of the exact sub curves instead of polylines.
+        With return_index the list holds (segment, pieces, index), index gives the position of the line
+        in segment.get_lines() each piece comes from.
+        """
+        segments = []
+        lines = []
+        line_curves = []
+        shifts = []
+        on_border = []
+        for hex in self.grid if hexagons is None else hexagons:
+            for segment in hex.segments:
+                if colour is None or segment.colour_group == colour:
+                    # The template lines are only moved below, all at once
+                    template = segment.template
+                    segments.append((segment, len(template.lines)))
+                    lines.extend(template.lines)
+                    if curves:
+                        line_curves.extend(template.curves)
+                    shifts.append(segment.shift)
+                    on_border.extend([hex.on_border] * len(template.lines))
+        lines = self.shift_lines(lines, shifts, [count for _, count in segments])
+        if curves:
+            line_curves = self.shift_lines(line_curves, shifts, [count for _, count in segments])
+
+        border_index = np.flatnonzero(on_border)
+        with instrument.stage("page_clip"):
+            pieces, source = clip_lines_to_rect([lines[k] for k in border_index], *self.draw_rect, return_index=True)
+            if curves:
+                # The cut pieces are replaced by the part of the curve they were cut from
+                pieces = piece_curves(line_curves, pieces, border_index[source])
+                lines = line_curves
+
+        # Keep the drawing order of the lines
+        clipped = [[line] for line in lines]
+        for k in border_index:
+            clipped[k] = []
+        for piece, k in zip(pieces, border_index[source]):
+            clipped[k].append(piece)
+
+        result = []
+        start = 0
+        for segment, count in segments:
+            segment_pieces = clipped[start:start + count]
+            pieces = [piece for line_pieces in segment_pieces for piece in line_pieces]
+            if return_index:
+                index = [position for position, line_pieces in enumerate(segment_pieces) for _ in line_pieces]
+                result.append((segment, pieces, index))
+            else:
+                result.append((segment, pieces))
+            start += count
+        return result
+
+    @staticmethod
+    def shift_lines(lines, shifts, counts):
+        """Move the lines of every segment by its shift, counts gives the number of lines of every segment."""
+        if not lines:
+            return []
+        lengths = np.array([len(line) for line in lines])
+        points = np.repeat(np.repeat(np.array(shifts, dtype=float).reshape(-1, 2), counts, axis=0), lengths, axis=0)
+        coords = np.concatenate(lines) + points
+        bounds = np.concatenate([[0], np.cumsum(lengths)]).tolist()
+        return [coords[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def clip_to_page(self, colour=None, hexagons=None, curves=False):
+        """Clipped lines (or curves) of all hexagons (or only of one colour group) in drawing order."""
+        return [piece for _, pieces in self.clip_segments(colour, hexagons, curves) for piece in pieces]
+
+    def clip_by_colour(self, curves=False):
+        """Clip every line once and sort the pieces by colour_group, in drawing order."""
+        lines_by_colour = {}
+        for segment, pieces in self.clip_segments(curves=curves):
+            lines_by_colour.setdefault(segment.colour_group, []).extend(pieces)
+        return lines_by_colour
+
+    def join_by_colour(self, colouring, curves=False):
+        """Clipped lines of every strand joined into continuous lines and sorted by colour_group, colouring gives the strands."""
+        lines_by_colour = {}
+        clipped = self.clip_segments(curves=curves, return_index=True)
+        with instrument.stage("strand_join"):
+            joined = join_strands(clipped, colouring.group_of, self.lines_per_segment)
+        for colour, line in joined:
+            lines_by_colour.setdefault(colour, []).append(line)
+        return lines_by_colour
+
+    def order_for_plotter(self, lines_by_colour, time_limit=1.0):
+        """
+        Order the lines of every colour for a pen plotter (nearest neighbour and 2-opt with at most time_limit s per colour).
+        The stats before and after are kept in self.plot_report, see format_plot_report.
+        """
+        ordered = {}
+        self.plot_report = {}
+        for colour, lines in lines_by_colour.items():
+            plot_order = _PlotOrder(lines)
+            ordered[colour] = plot_order.optimize(time_limit)
+            self.plot_report[colour] = {"before": plot_order.before, "after": plot_order.after}
+        return ordered
+
+    def format_plot_report(self):
+        """The stats of the last order_for_plotter as text, one line per colour."""
+        return "\n".join(f"Farbe {colour}: Stift unten {report['before']['pen_down']:.0f} mm, "
+                         f"Leerfahrt {report['before']['pen_up']:.0f} -> {report['after']['pen_up']:.0f} mm, "
+                         f"Zeit {report['before']['time'] / 60:.1f} -> {report['after']['time'] / 60:.1f} min"
+                         for colour, report in self.plot_report.items())
+
+    def iter_page_lines(self, colour=None, chunk_size=256, curves=False):
+        """Generator over the clipped lines, hexagons are clipped in chunks so only one chunk of lines is held at a time."""
+        for start in range(0, len(self.grid), chunk_size):
+            yield from self.clip_to_page(colour, self.grid[start:start + chunk_size], curves)
+
+    def replace_tile(self, id, offset=None, pattern=None, connection=None, rng=None, colour_count=5, mode="greedy"):
+        """
+        Replace the tile of the hexagon id without generating the grid again.
+        offset and pattern default to the current ones, connection sets the edge pairs directly.
+        Without connection the pairs are shuffled by rng, for a grid with seed it defaults to the generator
+        of the hexagon (see _Hexagon.tile_random), without seed it has to be given so the random module is not used.
+        Only the strands through the hexagon are grouped and coloured again, in the colouring of the
+        last draw_grid_coloured (a new one with colour_count and mode if there is none).
+        Returns the changed segments as list of dicts with "segment" (id_x, id_y, position), "colour", "stroke"
+        and "elements", the svg polylines of its clipped lines like in draw_grid_coloured, which replace
+        the old elements of that segment. Segments of other hexagons only change their colour,
+        their elements are None and only the stroke of their old elements has to be changed.
+        """
+        if self.index_of is None:
+            self.index_of = {(int(id_x), int(id_y)): index for index, (id_x, id_y) in enumerate(self.hexagons.id[:len(self.hexagons)])}
+        index = self.index_of.get(tuple(id))
+        if index is None:
+            raise ValueError("Ungültiger Wert!")
+        hexagon = self.grid[index]
+        if self.colouring is None:
+            self.colouring = _Colouring(self.grid, colour_count=colour_count, mode=mode)
+
+        offset = hexagon.offset if offset is None else offset
+        pattern = hexagon.pattern if pattern is None else pattern
+        if offset not in range(6):
+            raise ValueError("Ungültiger Wert!")
+        if connection is None:
+            if rng is None:
+                if self.seed is None:
+                    raise ValueError("Ungültiger Wert!")
+                rng = _Hexagon.tile_random(self.seed, *id)
+            connection = _Hexagon.tile_connection(offset, pattern)
+            rng.shuffle(connection)
+
+        with instrument.stage("replace_tile"):
+            self.hexagons.set_tile(index, (offset, pattern, connection))
+            segments = hexagon.segments
+            _, groups = self.colouring.update_strands(segments)
+            recoloured = []
+            if self.colouring.mode is not None:
+                recoloured = set(self.colouring.recolour(groups)) - set(segments)
+                recoloured = sorted(recoloured, key=lambda segment: (segment.hexagon, segment.position))
+
+            # Only the lines of the hexagon are clipped and written again
+            result = []
+            for segment, pieces in self.clip_segments(hexagons=[hexagon]) + [(segment, None) for segment in recoloured]:
+                colour = segment.colour_group
+                stroke = COLORS[colour] if colour < len(COLORS) else 'black'
+                result.append({
+                    "segment": (segment.id_x, segment.id_y, segment.position),
+                    "colour": colour,
+                    "stroke": stroke,
+                    "elements": None if pieces is None else [polyline_element(line, stroke=stroke, stroke_width=0.5) for line in pieces],
+                })
+        return result
+
     #draw mode to get a svg with every segment in one colour
-    def draw_grid_one_colour(self):
-        dwg = svgwrite.Drawing("hexagon_one_colour.svg", size=("210mm", "297mm"), viewBox=f"0 0 {self.width} {self.height}")
-        main_group = dwg.g()
-
-        list_hexagon = []
-
-        # Background
-        if self.background:
-            dwg.add(dwg.rect(insert=(0, 0), size=("100%", "100%"), fill="black"))
-
-        #generation of lines(segments per hexagons, hexagons per grid)
-        for hex in self.grid:
-            hexagon_lines = hex.get_curve_all()
-            for segment_lines in hexagon_lines:
-                for line in segment_lines:
-                    # Stelle sicher, dass `line` ein `LineString` ist
-                    line_geom = LineString(line)
-                    # Führe die Schnittoperation durch
-                    intersection = line_geom.intersection(self.draw_area)
-                    
-                    # Wenn die Schnittstelle nicht leer ist, füge sie zu SVG hinzu
-                    if not intersection.is_empty:
-                        # Falls es sich um ein MultiLineString handelt, gehe alle Segmente durch
-                        if intersection.geom_type == 'MultiLineString':
-                            for seg in intersection.geoms:
-                                main_group.add(svgwrite.shapes.Polyline(points=list(seg.coords), stroke='white', fill='none', stroke_width=0.5))
-                        # Falls es sich um einen LineString handelt, füge ihn direkt hinzu
-                        elif intersection.geom_type == 'LineString':
-                            main_group.add(svgwrite.shapes.Polyline(points=list(intersection.coords), stroke='white', fill='none', stroke_width=0.5))
+    def draw_grid_one_colour(self, encoding="polyline", precision=2, compress=False, join=False, plot_order=False, time_limit=1.0, name="hexagon_one_colour"):
+        """
+        Svg with every segment in one colour. encoding "path" writes compact <path> elements with
+        precision decimals, "bezier" writes every curve as one quadratic bezier path,
+        compress writes a gzip compressed .svgz file.
+        With join the pieces of every strand are written as continuous lines.
+        With plot_order the lines are ordered for a pen plotter, see order_for_plotter.
+        name is the path of the file without suffix. Returns the written file.
+        """
+        suffix = ".svgz" if compress else ".svg"
+        curves = encoding == "bezier"
+        if join:
+            colouring = _Colouring(self.grid, mode=None)
+            clipped = self.clip_segments(curves=curves, return_index=True)
+            with instrument.stage("strand_join"):
+                lines = [line for _, line in join_strands(clipped, colouring.group_of, self.lines_per_segment)]
+        else:
+            lines = self.iter_page_lines(curves=curves)
+        if plot_order:
+            with instrument.stage("plot_order"):
+                lines = self.order_for_plotter({0: list(lines)}, time_limit)[0]
+        with _SvgWriter(name + suffix, self.width, self.height, background=self.background, encoding=encoding, precision=precision) as svg:
+            #generation of lines(segments per hexagons, hexagons per grid)
+            svg.write_lines(lines, stroke='white', stroke_width=0.5)
+        return name + suffix
 
         #Add id of hexagon in center of hexagon
         #for hexagon in self.grid:
@@ -91,100 +364,97 @@ class _Grid():
         #    dwg.add(dwg.text(str(hexagon.id), insert=(center_x, center_y), fill='white', font_size='5px', text_anchor='middle'))
 
 
-        dwg.add(main_group)
-        dwg.save()
-
-
-    def draw_grid_coloured(self):
-        dwg = svgwrite.Drawing("hexagon_obj_coloured.svg", size=("210mm", "297mm"), viewBox=f"0 0 {self.width} {self.height}")
-        main_group = dwg.g()
-
-        colouring = _Colouring(grid.grid)
-        list_hexagon = []
-
-        # Background
-        if self.background:
-            dwg.add(dwg.rect(insert=(0, 0), size=("100%", "100%"), fill="black"))
-
-        COLORS = ['seagreen', 'red', 'skyblue', 'white', 'purple',
-        'orange', 'cyan', 'magenta', 'brown', 'gray', 'black']
-
+    def draw_grid_coloured(self, layers=False, workers=None, encoding="polyline", precision=2, compress=False, join=False, plot_order=False, time_limit=1.0, name="hexagon_obj_coloured", colour_count=5, mode="greedy"):
+        """
+        Svg with the lines coloured by strand groups. Every line is clipped once and sorted by colour,
+        then the combined file and the files per colour (written in parallel) are saved.
+        With layers one file with a named layer per colour is written instead.
+        encoding, precision and compress are passed to the svg writer like in draw_grid_one_colour,
+        with join the pieces of every strand are written as continuous lines
+        and with plot_order the lines of every colour are ordered for a pen plotter.
+        name is the path of the combined file without suffix, the files per colour get _<colour> added.
+        colour_count and mode are passed to _Colouring. Returns the written files.
+        """
+        colouring = self.colouring = _Colouring(self.grid, colour_count=colour_count, mode=mode)
+        if join:
+            lines_by_colour = self.join_by_colour(colouring, curves=encoding == "bezier")
+        else:
+            lines_by_colour = self.clip_by_colour(curves=encoding == "bezier")
+        if plot_order:
+            with instrument.stage("plot_order"):
+                lines_by_colour = self.order_for_plotter(lines_by_colour, time_limit)
+        suffix = ".svgz" if compress else ".svg"
+        options = dict(background=self.background, encoding=encoding, precision=precision)
+
+        if layers:
+            with _SvgWriter(name + suffix, self.width, self.height, main_group=False, **options) as svg:
+                for id_val in range(0,11):
+                    color = COLORS[id_val] if id_val < len(COLORS) else 'black'
+                    if lines_by_colour.get(id_val):
+                        svg.open_layer(f"colour_{id_val}", color)
+                        svg.write_lines(lines_by_colour[id_val], stroke=color, stroke_width=0.5)
+                        svg.close_layer()
+            return [name + suffix]
+
+        with _SvgWriter(name + suffix, self.width, self.height, **options) as svg:
+            #generation of lines(segments per hexagons, hexagons per grid)
+            for id_val in range(0,11):
+                color = COLORS[id_val] if id_val < len(COLORS) else 'black'
+                svg.write_lines(lines_by_colour.get(id_val, []), stroke=color, stroke_width=0.5)
+
+        # Save a seprate SVG for each colour group, files without lines are not written
+        def draw_colour(id_val):
+            color = COLORS[id_val] if id_val < len(COLORS) else 'black'
+            with _SvgWriter(f"{name}_{id_val}" + suffix, self.width, self.height, **options) as svg:
+                svg.write_lines(lines_by_colour[id_val], stroke=color, stroke_width=0.5)
+            return f"{name}_{id_val}" + suffix
 
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return [name + suffix] + list(executor.map(draw_colour, [id_val for id_val in range(0,11) if lines_by_colour.get(id_val)]))
 
-        #generation of lines(segments per hexagons, hexagons per grid)
-        for id_val in range(0,11):
-            color = COLORS[id_val] if id_val < len(COLORS) else 'black'
-            for hex in self.grid:
-                hexagon_lines = hex.get_curve_colour(id_val)
-                for segment_lines in hexagon_lines:
-                    for line in segment_lines:
-                        # Stelle sicher, dass `line` ein `LineString` ist
-                        line_geom = LineString(line)
-                        # Führe die Schnittoperation durch
-                        intersection = line_geom.intersection(self.draw_area)
-                        
-                        # Wenn die Schnittstelle nicht leer ist, füge sie zu SVG hinzu
-                        if not intersection.is_empty:
-                            # Falls es sich um ein MultiLineString handelt, gehe alle Segmente durch
-                            if intersection.geom_type == 'MultiLineString':
-                                for seg in intersection.geoms:
-                                    main_group.add(svgwrite.shapes.Polyline(points=list(seg.coords), stroke=color, fill='none', stroke_width=0.5))
-                            # Falls es sich um einen LineString handelt, füge ihn direkt hinzu
-                            elif intersection.geom_type == 'LineString':
-                                main_group.add(svgwrite.shapes.Polyline(points=list(intersection.coords), stroke=color, fill='none', stroke_width=0.5))
-
-        dwg.add(main_group)
-        dwg.save()
-
-
-        # Save a seprate SVG for each colour group
-        for id_val in range(0,11):
-            color = COLORS[id_val] if id_val < len(COLORS) else 'black'
-            dwg = svgwrite.Drawing(f"hexagon_obj_coloured_{id_val}.svg", size=("210mm", "297mm"), viewBox=f"0 0 {self.width} {self.height}")
-            main_group = dwg.g()
-
-            # Background
-            if self.background:
-                dwg.add(dwg.rect(insert=(0, 0), size=("100%", "100%"), fill="black"))
-
-            for hex in self.grid:
-                hexagon_lines = hex.get_curve_colour(id_val)
-                for segment_lines in hexagon_lines:
-                    for line in segment_lines:
-                        # Stelle sicher, dass `line` ein `LineString` ist
-                        line_geom = LineString(line)
-                        # Führe die Schnittoperation durch
-                        intersection = line_geom.intersection(self.draw_area)
-                        
-                        # Wenn die Schnittstelle nicht leer ist, füge sie zu SVG hinzu
-                        if not intersection.is_empty:
-                            # Falls es sich um ein MultiLineString handelt, gehe alle Segmente durch
-                            if intersection.geom_type == 'MultiLineString':
-                                for seg in intersection.geoms:
-                                    main_group.add(svgwrite.shapes.Polyline(points=list(seg.coords), stroke=color, fill='none', stroke_width=0.5))
-                            # Falls es sich um einen LineString handelt, füge ihn direkt hinzu
-                            elif intersection.geom_type == 'LineString':
-                                main_group.add(svgwrite.shapes.Polyline(points=list(intersection.coords), stroke=color, fill='none', stroke_width=0.5))
-
-            # Check if the main group has any elements befor saving
-            if main_group.elements:
-                dwg.add(main_group)
-                dwg.save()
-
-
-
-
-random.seed(1256)
-# Maße in mm
-a4_width_mm = 210
-a4_height_mm = 297
-offset_x = 0
-offset_y = 0
-margin_mm = 10
-hex_size = 20  # Außendurchmesser, ggf. in mm anpassen
-x=8
-
-grid = _Grid(a4_width_mm, a4_height_mm, hex_size, offset_y=10, background=True, hexagon_margin=0.15)
-grid.draw_grid_one_colour()
-grid.draw_grid_coloured()
-print("ggs")
+    def draw_preview(self, coloured=False, dpi=96, name=None, colour_count=5, mode="greedy"):
+        """
+        Png preview drawn straight from the lines of the tile templates, without writing a svg first.
+        Every template (or segment of a template) is rasterized once and added at all its hexagons,
+        the lines are cut at the draw area pixel by pixel instead of clipping them.
+        The colours are the same as in draw_grid_one_colour, or with coloured as in draw_grid_coloured
+        (colour_count and mode are passed to _Colouring). dpi sets the resolution,
+        name is the path without suffix (hexagon_one_colour or hexagon_obj_coloured by default). Returns the written file.
+        """
+        if name is None:
+            name = "hexagon_obj_coloured" if coloured else "hexagon_one_colour"
+        count = len(self.hexagons)
+        template = self.hexagons.template[:count]
+        center = self.hexagons.center[:count]
+        with _RasterWriter(name + ".png", self.width, self.height, dpi=dpi, background=self.background, clip_rect=self.draw_rect) as png:
+            if not coloured:
+                shapes = [[line for segment in tile.segments for line in segment.lines] for tile in self.hexagons.templates]
+                png.write_instances(shapes, template, center, stroke='white', stroke_width=0.5)
+            else:
+                self.colouring = _Colouring(self.grid, colour_count=colour_count, mode=mode)
+                shapes = [segment.lines for tile in self.hexagons.templates for segment in tile.segments]
+                colour_group = self.hexagons.colour_group[:count]
+                for id_val in range(0,11):
+                    color = COLORS[id_val] if id_val < len(COLORS) else 'black'
+                    index, position = np.nonzero(colour_group == id_val)
+                    png.write_instances(shapes, 3 * template[index] + position, center[index], stroke=color, stroke_width=0.5)
+        return name + ".png"
+
+
+
+
+if __name__ == "__main__":
+    random.seed(1256)
+    # Maße in mm
+    a4_width_mm = 210
+    a4_height_mm = 297
+    offset_x = 0
+    offset_y = 0
+    margin_mm = 10
+    hex_size = 20  # Außendurchmesser, ggf. in mm anpassen
+    x=8
+
+    grid = _Grid(a4_width_mm, a4_height_mm, hex_size, offset_y=10, background=True, hexagon_margin=0.15)
+    grid.draw_grid_one_colour()
+    grid.draw_grid_coloured()
+    print("ggs")
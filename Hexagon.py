@@ -4,64 +4,186 @@ from shapely.geometry import Polygon, LineString, LinearRing
 import numpy as np
 from shapely.validation import explain_validity
 import random
-from shapely.affinity import rotate, scale
+from shapely.affinity import rotate, scale, translate
 from Segment import _Segment
+from TileCache import tile_cache
+from HexagonArrays import _HexagonArrays
 
 
 
 class _Hexagon:
-    def __init__(self, center_x, center_y, size, id, offset = False, pattern = False, lines_per_segment = 5, margin=0.2):
+    __slots__ = ("arrays", "index")
+
+    def __init__(self, center_x, center_y, size, id, offset = False, pattern = False, lines_per_segment = 5, margin=0.2, cache=tile_cache, tile=None, rng=random, tolerance=None):
         """
         Initialize a hexagon with the given parameters.
+        The geometry is taken from the tile cache and moved to the center.
+        tile is an already drawn (offset, pattern, connection), otherwise it is drawn from rng.
+        tolerance is the chord error of the sampled curves, see _SegmentTemplate.
+        A hexagon is a view on one row of _HexagonArrays, created like this it gets arrays of its own,
+        the hexagons of a grid are views on the arrays of the grid (see view).
         """
-        self.center_x = center_x
-        self.center_y = center_y
-        self.center = (self.center_x, self.center_y)
-        self.size = size
-        self.lines_per_segment = lines_per_segment
-        self.margin = margin
-        self.id = id  # ID as a list [row, column]
-        self.id_x, self.id_y = id
-        self.segments = []
+        if tile is None:
+            tile = self.choose_tile(offset, pattern, rng)
+        self.arrays = _HexagonArrays(size, lines_per_segment, margin, tolerance, cache, capacity=1)
+        self.index = self.arrays.append(center_x, center_y, id, tile)
 
-        if not offset:
-            self.offset = random.randint(0, 5)
-        else:
-            self.offset = 0
+    @classmethod
+    def view(cls, arrays, index):
+        """Hexagon number index of the arrays."""
+        hexagon = cls.__new__(cls)
+        hexagon.arrays = arrays
+        hexagon.index = index
+        return hexagon
+
+    @property
+    def center_x(self):
+        return self.arrays.center[self.index, 0]
+
+    @property
+    def center_y(self):
+        return self.arrays.center[self.index, 1]
+
+    @property
+    def center(self):
+        return (self.center_x, self.center_y)
+
+    @property
+    def size(self):
+        return self.arrays.size
+
+    @property
+    def lines_per_segment(self):
+        return self.arrays.lines_per_segment
+
+    @property
+    def margin(self):
+        return self.arrays.margin
+
+    @property
+    def tolerance(self):
+        return self.arrays.tolerance
+
+    @property
+    def id(self):
+        # ID as a list [row, column]
+        return self.arrays.id[self.index].tolist()
+
+    @property
+    def id_x(self):
+        return int(self.arrays.id[self.index, 0])
+
+    @property
+    def id_y(self):
+        return int(self.arrays.id[self.index, 1])
+
+    @property
+    def offset(self):
+        return int(self.arrays.offset[self.index])
+
+    @property
+    def pattern(self):
+        return int(self.arrays.pattern[self.index])
+
+    @property
+    def connection(self):
+        return self.arrays.connection[self.index].tolist()
+
+    @property
+    def on_border(self):
+        return bool(self.arrays.on_border[self.index])
+
+    @on_border.setter
+    def on_border(self, value):
+        self.arrays.on_border[self.index] = value
+
+    @property
+    def template(self):
+        # Segments and draw area only depend on the connection order, so they are computed once around the origin
+        return self.arrays.template_of(self.index)
+
+    @property
+    def points(self):
+        return [(self.center_x + x, self.center_y + y) for x, y in self.template.points]
 
-        self.points, self.polygon = self.generate_hexagon_points()
-        self.draw_area = self.polygon
-        self.points2 = self.points[self.offset:] + self.points[:self.offset]
-       
+    @property
+    def points2(self):
+        points = self.points
+        return points[self.offset:] + points[:self.offset]
 
+    @property
+    def segments(self):
+        return [_Segment(self.arrays, self.index, position) for position in range(3)]
 
+    def __eq__(self, other):
+        return isinstance(other, _Hexagon) and self.arrays is other.arrays and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.arrays), self.index))
+
+    @staticmethod
+    def choose_tile(offset=False, pattern=False, rng=random):
+        """
+        Draw offset, pattern and the shuffled connection order of a tile from rng (the random module by default).
+        Returns (offset, pattern, connection).
+        """
+        if not offset:
+            offset_value = rng.randint(0, 5)
+        else:
+            offset_value = 0
 
         if not pattern :
-            self.pattern = random.choices(population=[1, 2, 3, 4, 5],weights=[100,100,100, 100, 100],k=1)[0]
+            pattern_value = rng.choices(population=[1, 2, 3, 4, 5],weights=[100,100,100, 100, 100],k=1)[0]
         else: 
-            self.pattern = pattern
+            pattern_value = pattern
         
-        if self.pattern == 1:
-            self.connection = [[(0 + self.offset) % 6,(1 + self.offset) % 6],[(2 + self.offset) % 6,(3 + self.offset) % 6],[(4 + self.offset) % 6,(5 + self.offset) % 6]]
-        elif self.pattern == 2:
-            self.connection = [[(0 + self.offset) % 6,(1 + self.offset) % 6],[(2 + self.offset) % 6,(4 + self.offset) % 6],[(3 + self.offset) % 6,(5 + self.offset) % 6]]
-        elif self.pattern == 3:
-            self.connection = [[(0 + self.offset) % 6,(3 + self.offset) % 6],[(1 + self.offset) % 6,(4 + self.offset) % 6],[(2 + self.offset) % 6,(5 + self.offset) % 6]]
-        elif self.pattern == 4:
-            self.connection = [[(0 + self.offset) % 6,(1 + self.offset) % 6],[(2 + self.offset) % 6,(5 + self.offset) % 6],[(3 + self.offset) % 6,(4 + self.offset) % 6]]
-        elif self.pattern == 5:
-            self.connection = [[(0 + self.offset) % 6,(2 + self.offset) % 6],[(1 + self.offset) % 6,(4 + self.offset) % 6],[(3 + self.offset) % 6,(5 + self.offset) % 6]]
+        connection = _Hexagon.tile_connection(offset_value, pattern_value)
+        rng.shuffle(connection)
+
+        return offset_value, pattern_value, connection
+
+    @staticmethod
+    def tile_connection(offset_value, pattern_value):
+        """Connected edge pairs of a pattern rotated by offset, in drawing order before shuffling."""
+        if pattern_value == 1:
+            connection = [[(0 + offset_value) % 6,(1 + offset_value) % 6],[(2 + offset_value) % 6,(3 + offset_value) % 6],[(4 + offset_value) % 6,(5 + offset_value) % 6]]
+        elif pattern_value == 2:
+            connection = [[(0 + offset_value) % 6,(1 + offset_value) % 6],[(2 + offset_value) % 6,(4 + offset_value) % 6],[(3 + offset_value) % 6,(5 + offset_value) % 6]]
+        elif pattern_value == 3:
+            connection = [[(0 + offset_value) % 6,(3 + offset_value) % 6],[(1 + offset_value) % 6,(4 + offset_value) % 6],[(2 + offset_value) % 6,(5 + offset_value) % 6]]
+        elif pattern_value == 4:
+            connection = [[(0 + offset_value) % 6,(1 + offset_value) % 6],[(2 + offset_value) % 6,(5 + offset_value) % 6],[(3 + offset_value) % 6,(4 + offset_value) % 6]]
+        elif pattern_value == 5:
+            connection = [[(0 + offset_value) % 6,(2 + offset_value) % 6],[(1 + offset_value) % 6,(4 + offset_value) % 6],[(3 + offset_value) % 6,(5 + offset_value) % 6]]
         else:
             raise ValueError("Ungültiger Wert!")
-        
-        random.shuffle(self.connection)
+        return connection
+
+    @staticmethod
+    def tile_random(seed, id_x, id_y):
+        """Random generator of one hexagon, derived from the global seed and the hexagon id."""
+        # String seeds are hashed with sha512, so they are the same in every process
+        return random.Random(f"{seed}:{id_x}:{id_y}")
 
-        # Create segments based on connections
-        # Draw Area from Hexagon and Update it
-        for connection in self.connection:
-            segment = _Segment(self.id, connection, self.center_x, self.center_y, self.size, self.draw_area, self.points, lines_per_segment=self.lines_per_segment, margin=self.margin)
-            self.draw_area = self.draw_area.difference(segment.get_erase_polygon())
-            self.segments.append(segment)
+    @property
+    def polygon(self):
+        return translate(self.template.polygon, self.center_x, self.center_y)
+
+    @property
+    def draw_area(self):
+        # Hexagon area left after erasing all segments
+        return translate(self.template.draw_area, self.center_x, self.center_y)
+
+    @property
+    def bounds(self):
+        """Bounding box (min_x, min_y, max_x, max_y) of the hexagon."""
+        return self.bounds_at(self.center_x, self.center_y, self.size)
+
+    @staticmethod
+    def bounds_at(center_x, center_y, size):
+        """Bounding box of a hexagon with the given center and size, without creating it."""
+        r_y = size * math.sqrt(3) / 2
+        return (center_x - size, center_y - r_y, center_x + size, center_y + r_y)
 
     # calculate hexagon points and returning them as well as the polygon
     def generate_hexagon_points(self, rotation_deg=0):
@@ -94,3 +216,27 @@ class _Hexagon:
             if segment.colour_group == id:
                 lines.append(segment.get_lines())
         return lines
+
+
+class _HexagonList:
+    """Sequence of the hexagons of _HexagonArrays, the views are created when they are accessed."""
+    __slots__ = ("arrays",)
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [_Hexagon.view(self.arrays, position) for position in range(*index.indices(len(self.arrays)))]
+        if index < 0:
+            index += len(self.arrays)
+        if not 0 <= index < len(self.arrays):
+            raise IndexError("hexagon index out of range")
+        return _Hexagon.view(self.arrays, index)
+
+    def __iter__(self):
+        for index in range(len(self.arrays)):
+            yield _Hexagon.view(self.arrays, index)
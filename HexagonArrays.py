@@ -0,0 +1,109 @@
+import numpy as np
+from TileCache import tile_cache
+
+
+class _HexagonArrays():
+    def __init__(self, size, lines_per_segment=5, margin=0.2, tolerance=None, cache=tile_cache, capacity=0):
+        """
+        Structure of arrays holding all hexagons of a grid, _Hexagon and _Segment are views on it.
+        Per hexagon only id, center, offset, pattern, connection, the number of its tile template,
+        on_border and the colour_group of its three segments are stored (about 45 bytes),
+        the geometry is shared by all hexagons with the same template.
+        capacity is the number of hexagons space is reserved for, the arrays grow when needed.
+        """
+        self.size = size
+        self.lines_per_segment = lines_per_segment
+        self.margin = margin
+        self.tolerance = tolerance
+        self.cache = cache
+        self.templates = []  # Tile templates used by the hexagons, referenced by their number
+        self.template_number = {}
+        self.count = 0
+
+        self.id = np.zeros((capacity, 2), dtype=np.int32)
+        self.center = np.zeros((capacity, 2))
+        self.offset = np.zeros(capacity, dtype=np.int8)
+        self.pattern = np.zeros(capacity, dtype=np.int8)
+        self.connection = np.zeros((capacity, 3, 2), dtype=np.int8)
+        self.template = np.zeros(capacity, dtype=np.int32)
+        self.on_border = np.zeros(capacity, dtype=bool)
+        self.colour_group = np.zeros((capacity, 3), dtype=np.int16)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, center_x, center_y, id, tile, on_border=False):
+        """Add a hexagon with the tile (offset, pattern, connection) and return its number."""
+        if self.count == len(self.id):
+            self.resize(max(16, 2 * self.count))
+        offset, pattern, connection = tile
+
+        # The template is kept here as well, so it stays valid when the cache drops it
+        template = self.cache.get(connection, self.size, self.lines_per_segment, self.margin, self.tolerance)
+        number = self.template_number.get(template)
+        if number is None:
+            number = self.template_number[template] = len(self.templates)
+            self.templates.append(template)
+
+        index = self.count
+        self.id[index] = id
+        self.center[index] = (center_x, center_y)
+        self.offset[index] = offset
+        self.pattern[index] = pattern
+        self.connection[index] = connection
+        self.template[index] = number
+        self.on_border[index] = on_border
+        self.colour_group[index] = 0
+        self.count += 1
+        return index
+
+    def set_tile(self, index, tile):
+        """Replace the tile (offset, pattern, connection) of hexagon number index."""
+        offset, pattern, connection = tile
+        template = self.cache.get(connection, self.size, self.lines_per_segment, self.margin, self.tolerance)
+        number = self.template_number.get(template)
+        if number is None:
+            number = self.template_number[template] = len(self.templates)
+            self.templates.append(template)
+        self.offset[index] = offset
+        self.pattern[index] = pattern
+        self.connection[index] = connection
+        self.template[index] = number
+
+    def resize(self, capacity):
+        """Change the reserved space, e.g. to release the unused rest after all hexagons are added."""
+        for name in ("id", "center", "offset", "pattern", "connection", "template", "on_border", "colour_group"):
+            array = getattr(self, name)
+            resized = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            keep = min(capacity, self.count)
+            resized[:keep] = array[:keep]
+            setattr(self, name, resized)
+
+    def trim(self):
+        self.resize(self.count)
+
+    def template_of(self, index):
+        return self.templates[self.template[index]]
+
+    def nbytes(self):
+        """Memory of the per hexagon arrays."""
+        return sum(getattr(self, name).nbytes for name in ("id", "center", "offset", "pattern", "connection", "template", "on_border", "colour_group"))
+
+    def line_buffer(self, dtype=np.float32):
+        """
+        Coordinates of all lines of all hexagons as one flat (points, 2) buffer.
+        Returns (coords, offsets, segment) with the points of line k in coords[offsets[k]:offsets[k + 1]]
+        and segment[k] = 3 * hexagon + position of the segment the line belongs to.
+        """
+        lines = []
+        segment = []
+        for index in range(self.count):
+            template = self.templates[self.template[index]]
+            for position, template_segment in enumerate(template.segments):
+                for line in template_segment.lines:
+                    lines.append((line + self.center[index]).astype(dtype))
+                    segment.append(3 * index + position)
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(line) for line in lines])
+        coords = np.concatenate(lines) if lines else np.empty((0, 2), dtype=dtype)
+        return coords, offsets, np.array(segment, dtype=np.int64)
@@ -0,0 +1,126 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext, ExitStack
+
+
+# Returned by stage() while the instrumentation is off, so a stage costs one call and one check
+_NULL_STAGE = nullcontext()
+
+
+class _Instrument():
+    def __init__(self):
+        """
+        Timings of the stages and counters of one render.
+        Off by default, then stage() returns a shared empty context and count() returns at once.
+        Hooks are called with the stage name when a stage starts and return a context manager
+        (or None) that is active during the stage, e.g. to run a profiler only for some stages.
+        The time of nested stages is also part of the outer stage.
+        Work done in other processes (tiles of TiledRender) is not recorded.
+        """
+        self.enabled = False
+        self.hooks = []
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stages = {}  # Stage name -> [total time, calls]
+        self.counters = {}
+
+    def stage(self, name):
+        """Context manager that adds the time of the block to the stage name."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        with ExitStack() as stack:
+            for hook in self.hooks:
+                context = hook(name)
+                if context is not None:
+                    stack.enter_context(context)
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    total = self.stages.setdefault(name, [0.0, 0])
+                    total[0] += elapsed
+                    total[1] += 1
+
+    def count(self, name, value=1):
+        """Add value to the counter name."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Set the counter name, for values like the number of groups before merging."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = value
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    @contextmanager
+    def recording(self):
+        """Reset, record everything inside the block and switch off again, the results stay for report()."""
+        self.reset()
+        self.enabled = True
+        try:
+            yield self
+        finally:
+            self.enabled = False
+
+    def report(self):
+        """Structured report: {"stages": {name: {"time", "calls"}}, "counters": {name: value}}."""
+        return {
+            "stages": {name: {"time": total, "calls": calls} for name, (total, calls) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def format_report(self):
+        """The report as text table, stages sorted by time."""
+        lines = [f"{'Stage':24s} {'Zeit ms':>10s} {'Aufrufe':>8s}"]
+        for name, (total, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{name:24s} {total * 1000:10.1f} {calls:8d}")
+        lines.append("")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:24s} {value:>10}")
+        return "\n".join(lines)
+
+
+def profile_hook(profiler, stages=None):
+    """
+    Hook that runs profiler (e.g. cProfile.Profile()) during the given stages, or all stages if None.
+    Nested stages keep the profiler running until the outermost one ends.
+    """
+    depth = [0]
+
+    @contextmanager
+    def hook(name):
+        if stages is not None and name not in stages:
+            yield
+            return
+        if depth[0] == 0:
+            profiler.enable()
+        depth[0] += 1
+        try:
+            yield
+        finally:
+            depth[0] -= 1
+            if depth[0] == 0:
+                profiler.disable()
+
+    return hook
+
+
+# Shared instrumentation of the process
+instrument = _Instrument()
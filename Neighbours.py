@@ -0,0 +1,12 @@
+# Offset (dx, dy) of the id of the neighbouring hexagon across each edge 0-5.
+# Odd rows are shifted by half a column, so the offsets depend on id_y % 2.
+NEIGHBOUR_OFFSETS = {
+    0: [(0, 1), (0, 2), (-1, 1), (-1, -1), (0, -2), (0, -1)],
+    1: [(1, 1), (0, 2), (0, 1), (0, -1), (0, -2), (1, -1)],
+}
+
+
+def neighbour_edge(id_x, id_y, edge):
+    """Return (id_x, id_y, edge) of the same border seen from the neighbouring hexagon."""
+    dx, dy = NEIGHBOUR_OFFSETS[id_y % 2][edge]
+    return id_x + dx, id_y + dy, (edge + 3) % 6
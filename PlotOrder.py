@@ -0,0 +1,155 @@
+import math
+import time
+import numpy as np
+
+
+class _PlotOrder():
+    def __init__(self, lines, start=(0, 0), speed_down=25, speed_up=75, pen_lift=0.15):
+        """
+        Order the lines of one colour layer for a pen plotter and choose the direction of every line.
+        The pen starts at start, speed_down and speed_up are the speeds with pen down and up in mm/s,
+        pen_lift is the time in s to lift and lower the pen once.
+        Lines are (n, 2) arrays, for bezier curves the control polygon is used as their length.
+        """
+        self.lines = list(lines)
+        self.start = np.asarray(start, dtype=float)
+        self.speed_down = speed_down
+        self.speed_up = speed_up
+        self.pen_lift = pen_lift
+
+    def stats(self, lines=None):
+        """Pen down length, pen up travel (both in mm), pen lifts and the estimated plot time in s."""
+        lines = self.lines if lines is None else lines
+        pen_down = sum(float(np.linalg.norm(np.diff(line, axis=0), axis=1).sum()) for line in lines)
+        pen_up = 0.0
+        position = self.start
+        for line in lines:
+            pen_up += float(np.linalg.norm(line[0] - position))
+            position = line[-1]
+        return {
+            "pen_down": pen_down,
+            "pen_up": pen_up,
+            "lifts": len(lines),
+            "time": pen_down / self.speed_down + pen_up / self.speed_up + len(lines) * self.pen_lift,
+        }
+
+    def optimize(self, time_limit=1.0):
+        """
+        Nearest neighbour order improved by 2-opt until no move helps or time_limit (s) is used up.
+        Returns the ordered lines, self.before and self.after hold the stats.
+        """
+        self.before = self.stats()
+        if len(self.lines) < 2:
+            self.after = self.before
+            return self.lines
+
+        order, reverse = self.nearest_neighbour()
+        order, reverse = self.two_opt(order, reverse, time.perf_counter() + time_limit)
+        lines = [self.lines[k][::-1] if flip else self.lines[k] for k, flip in zip(order, reverse)]
+
+        # The order is only used if it is faster than the drawing order
+        self.after = self.stats(lines)
+        if self.after["time"] > self.before["time"]:
+            self.after = self.before
+            return self.lines
+        return lines
+
+    def nearest_neighbour(self):
+        """
+        Greedy order: always continue with the line that has an end closest to the pen.
+        The ends are kept in a grid of cells, the search looks at rings of cells around the pen
+        until no closer end can be found in the next ring.
+        Returns the order of the lines and whether each one is drawn reversed.
+        """
+        count = len(self.lines)
+        ends = np.array([[line[0], line[-1]] for line in self.lines], dtype=float)
+        points = ends.reshape(-1, 2)
+
+        min_corner = np.minimum(points.min(axis=0), self.start)
+        extent = np.maximum(points.max(axis=0), self.start) - min_corner
+        cell_size = max(math.sqrt(extent[0] * extent[1] / count), extent.max() / count, 1e-9)
+        cell_of = np.floor((points - min_corner) / cell_size).astype(int)
+        max_ring = int(cell_of.max()) + 1
+
+        # Cell -> ends in it, an end is number 2 * line + (0 start, 1 end)
+        cells = {}
+        for end, (cell_x, cell_y) in enumerate(cell_of.tolist()):
+            cells.setdefault((cell_x, cell_y), set()).add(end)
+
+        order = []
+        reverse = []
+        position = self.start
+        for _ in range(count):
+            cell_x, cell_y = np.floor((position - min_corner) / cell_size).astype(int).tolist()
+            best = None
+            best_distance = math.inf
+            ring = 0
+            # Ends outside of the rings searched so far are at least (ring - 1) cells away
+            while best_distance > (ring - 1) * cell_size and ring <= max_ring:
+                for key in self.ring_cells(cell_x, cell_y, ring):
+                    for end in cells.get(key, ()):
+                        distance = math.hypot(points[end, 0] - position[0], points[end, 1] - position[1])
+                        if distance < best_distance or (distance == best_distance and end < best):
+                            best, best_distance = end, distance
+                ring += 1
+
+            line, flip = divmod(best, 2)
+            order.append(line)
+            reverse.append(bool(flip))
+            for end in (2 * line, 2 * line + 1):
+                key = tuple(cell_of[end].tolist())
+                cells[key].discard(end)
+                if not cells[key]:
+                    del cells[key]
+            position = ends[line, 1 - flip]
+
+        return order, reverse
+
+    @staticmethod
+    def ring_cells(cell_x, cell_y, ring):
+        """Cells with the chebyshev distance ring to the cell (cell_x, cell_y)."""
+        if ring == 0:
+            return [(cell_x, cell_y)]
+        cells = []
+        for dx in range(-ring, ring + 1):
+            cells.append((cell_x + dx, cell_y - ring))
+            cells.append((cell_x + dx, cell_y + ring))
+        for dy in range(-ring + 1, ring):
+            cells.append((cell_x - ring, cell_y + dy))
+            cells.append((cell_x + ring, cell_y + dy))
+        return cells
+
+    def two_opt(self, order, reverse, deadline):
+        """
+        Reverse parts order[i:j+1] of the tour (which also turns every line in it) while that shortens the pen up travel.
+        For every i the gain of all j is computed at once, the best move is taken.
+        """
+        order = np.array(order)
+        reverse = np.array(reverse)
+        ends = np.array([[line[0], line[-1]] for line in self.lines], dtype=float)
+        count = len(order)
+
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            starts = ends[order, reverse.astype(int)]
+            stops = ends[order, 1 - reverse.astype(int)]
+            for i in range(count):
+                if time.perf_counter() >= deadline:
+                    break
+                before = self.start if i == 0 else stops[i - 1]
+                j = np.arange(i, count)
+                # Travel to the part and away from it, after and before the reversal
+                after = np.vstack([starts[i + 1:], [[np.nan, np.nan]]])
+                old = np.linalg.norm(starts[i] - before) + np.nan_to_num(np.linalg.norm(after - stops[j], axis=1))
+                new = np.linalg.norm(stops[j] - before, axis=1) + np.nan_to_num(np.linalg.norm(after - starts[i], axis=1))
+                gain = old - new
+                best = int(np.argmax(gain))
+                if gain[best] > 1e-9:
+                    j = i + best
+                    order[i:j + 1] = order[i:j + 1][::-1].copy()
+                    reverse[i:j + 1] = ~reverse[i:j + 1][::-1]
+                    starts[i:j + 1], stops[i:j + 1] = stops[i:j + 1][::-1].copy(), starts[i:j + 1][::-1].copy()
+                    improved = True
+
+        return order.tolist(), reverse.tolist()
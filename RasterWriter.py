@@ -0,0 +1,275 @@
+import math
+import zlib
+import struct
+import numpy as np
+from Instrument import instrument
+
+
+# RGB of the colour names used for the strokes and the background
+NAMED_COLOURS = {
+    'black': (0, 0, 0), 'white': (255, 255, 255), 'seagreen': (46, 139, 87), 'red': (255, 0, 0),
+    'skyblue': (135, 206, 235), 'purple': (128, 0, 128), 'orange': (255, 165, 0), 'cyan': (0, 255, 255),
+    'magenta': (255, 0, 255), 'brown': (165, 42, 42), 'gray': (128, 128, 128),
+}
+
+# Sub pixel positions per axis the sprites of write_instances are drawn at
+PHASES = 4
+
+
+def parse_colour(colour):
+    """RGB of a colour name or a "#rrggbb" string as floats between 0 and 1."""
+    if colour.startswith("#") and len(colour) == 7:
+        return np.array([int(colour[k:k + 2], 16) for k in (1, 3, 5)], dtype=np.float32) / 255
+    if colour not in NAMED_COLOURS:
+        raise ValueError("Ungültiger Wert!")
+    return np.array(NAMED_COLOURS[colour], dtype=np.float32) / 255
+
+
+def write_png(filename, image, dpi=None):
+    """Write a (height, width, 3) uint8 image as 8 bit RGB png, dpi is stored as pixel size if given."""
+    height, width, _ = image.shape
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    # Every row starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, 3 * width)])
+    with open(filename, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        if dpi is not None:
+            pixels_per_metre = round(dpi / 0.0254)
+            file.write(chunk(b"pHYs", struct.pack(">IIB", pixels_per_metre, pixels_per_metre, 1)))
+        file.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 1)))
+        file.write(chunk(b"IEND", b""))
+
+
+def line_coverage(points, ends, radius, batch=2 ** 20):
+    """
+    Antialiased coverage of lines in pixel coordinates, line k is points[ends[k - 1]:ends[k]].
+    The lines are drawn as union of discs of the given radius placed at most half a pixel apart:
+    a pixel is covered 1 inside a disc, falling off over one pixel at its edge,
+    lines thinner than a pixel only get the part of the pixel they cover.
+    Yields (pixel_x, pixel_y, coverage) of batches of samples, a pixel can appear more than once.
+    """
+    if len(points) == 0:
+        return
+
+    # Points in the same half pixel as the point before are left out, the first and last point of every line are kept
+    cell = np.floor(points * 2).astype(np.int32)
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = (cell[1:] != cell[:-1]).any(axis=1)
+    keep[ends - 1] = True
+    first = np.zeros(len(points), dtype=bool)
+    first[0] = True
+    first[ends[:-1]] = True
+    keep |= first
+    points = points[keep]
+    first = first[keep]
+
+    # Samples along every line, at most half a pixel apart, and the last point of every line
+    inside = ~first[1:]
+    start = points[:-1][inside]
+    step = points[1:][inside] - start
+    steps = np.maximum(np.ceil(np.hypot(step[:, 0], step[:, 1]) * 2), 1).astype(np.int64)
+    segment = np.repeat(np.arange(len(start)), steps)
+    t = (np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+    last = np.append(np.flatnonzero(first)[1:] - 1, len(points) - 1)
+    samples = np.vstack([start[segment] + step[segment] * t[:, None].astype(points.dtype), points[last]])
+
+    # Only the pixels with their center closer than radius + 0.5 are reached, 2 * reach of them per axis
+    reach = math.ceil(radius + 0.5)
+    offset_y, offset_x = np.mgrid[1 - reach:reach + 1, 1 - reach:reach + 1]
+    offset_x = offset_x.ravel().astype(np.int32)
+    offset_y = offset_y.ravel().astype(np.int32)
+    limit = np.float32(min(2 * radius, 1.0))
+    size = max(1, batch // len(offset_x))
+    for begin in range(0, len(samples), size):
+        part = samples[begin:begin + size]
+        pixel_x = np.floor(part[:, 0] - np.float32(0.5)).astype(np.int32)[:, None] + offset_x
+        pixel_y = np.floor(part[:, 1] - np.float32(0.5)).astype(np.int32)[:, None] + offset_y
+        distance = np.hypot(pixel_x + np.float32(0.5) - part[:, :1], pixel_y + np.float32(0.5) - part[:, 1:])
+        coverage = np.minimum(np.float32(radius + 0.5) - distance, limit)
+        keep = coverage > 0
+        yield pixel_x[keep], pixel_y[keep], coverage[keep]
+
+
+class _RasterWriter():
+    def __init__(self, filename, width, height, dpi=96, background=True, min_x=0, min_y=0, clip_rect=None, chunk_size=4096):
+        """
+        Draw lines straight into a pixel buffer and save it as png, used like _SvgWriter as context manager.
+        width, height, min_x and min_y are the drawing area in mm (the viewBox of the svg), dpi gives the pixel size.
+        The background is black like the svg background, or white without background.
+        Every write call is one layer: its lines are drawn into a coverage buffer (see line_coverage),
+        which is then blended over the image in the stroke colour.
+        With clip_rect (min_x, min_y, max_x, max_y in mm) only the pixels with their center in the rectangle are drawn,
+        so unclipped lines can be passed in. write_lines reads the lines in chunks of chunk_size lines.
+        """
+        self.filename = filename
+        self.min_x = min_x
+        self.min_y = min_y
+        self.dpi = dpi
+        self.scale = dpi / 25.4  # Pixels per mm
+        self.pixel_width = max(1, round(width * self.scale))
+        self.pixel_height = max(1, round(height * self.scale))
+        self.background = background
+        self.chunk_size = chunk_size
+        self.clip = (0, 0, self.pixel_width, self.pixel_height)  # Pixel columns and rows that are drawn
+        if clip_rect is not None:
+            x0, y0, x1, y1 = [round((value - origin) * self.scale) for value, origin in zip(clip_rect, (min_x, min_y, min_x, min_y))]
+            self.clip = (max(x0, 0), max(y0, 0), min(x1, self.pixel_width), min(y1, self.pixel_height))
+        self.sprites = {}  # (shapes id, radius, shape, phase x, phase y) -> sprite of write_instances
+        self.shapes = {}  # shapes id -> (shapes, points of every shape in pixels)
+        self.count = 0
+        self.image = None
+        self.coverage = None
+
+    def __enter__(self):
+        self.image = np.empty((self.pixel_height, self.pixel_width, 3), dtype=np.float32)
+        self.image[:] = parse_colour('black' if self.background else 'white')
+        self.coverage = np.zeros(self.pixel_height * self.pixel_width, dtype=np.float32)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            with instrument.stage("png_encoding"):
+                write_png(self.filename, np.round(self.image * 255).astype(np.uint8), self.dpi)
+        self.image = self.coverage = None
+        return False
+
+    def pixels(self, points):
+        """Points in mm as float32 pixel coordinates."""
+        return ((np.asarray(points, dtype=np.float64) - (self.min_x, self.min_y)) * self.scale).astype(np.float32)
+
+    def write_lines(self, lines, stroke="white", stroke_width=0.5):
+        """Draw an iterable of (n, 2) lines in mm with the stroke colour and stroke_width (in mm)."""
+        radius = stroke_width * self.scale / 2
+        touched = [self.pixel_height, self.pixel_width, 0, 0]  # Rows and columns with coverage
+        with instrument.stage("rasterization"):
+            chunk = []
+            for line in lines:
+                chunk.append(line)
+                if len(chunk) == self.chunk_size:
+                    self.draw_chunk(chunk, radius, touched)
+                    chunk = []
+            if chunk:
+                self.draw_chunk(chunk, radius, touched)
+            self.blend(parse_colour(stroke), touched)
+
+    def draw_chunk(self, lines, radius, touched):
+        self.count += len(lines)
+        points = self.pixels(np.concatenate(lines))
+        for pixel_x, pixel_y, coverage in line_coverage(points, np.cumsum([len(line) for line in lines]), radius):
+            self.add_coverage(pixel_x, pixel_y, coverage, touched)
+
+    def write_instances(self, shapes, shape_index, positions, stroke="white", stroke_width=0.5):
+        """
+        Draw many copies of a few line sets, like the tile templates of a grid: shapes is a list of lists of (n, 2) lines
+        in mm around the origin, copy k is shapes[shape_index[k]] moved to positions[k].
+        Every shape is drawn once per sub pixel phase (1 / PHASES pixel) into a sprite, the copies only add their sprite,
+        so the positions are rounded to 1 / PHASES pixel.
+        """
+        radius = stroke_width * self.scale / 2
+        touched = [self.pixel_height, self.pixel_width, 0, 0]
+        with instrument.stage("rasterization"):
+            position = self.pixels(positions).astype(np.float64) if len(positions) else np.empty((0, 2))
+            whole = np.floor(position)
+            phase = np.round((position - whole) * PHASES).astype(np.int64)
+            whole = whole.astype(np.int64) + phase // PHASES
+            phase %= PHASES
+
+            # Copies with the same sprite are added together
+            shape_index = np.asarray(shape_index, dtype=np.int64)
+            key = (shape_index * PHASES + phase[:, 0]) * PHASES + phase[:, 1]
+            order = np.argsort(key, kind="stable")
+            groups = np.split(order, np.flatnonzero(np.diff(key[order])) + 1) if len(order) else []
+            sprites = self.make_sprites(shapes, [(int(shape_index[group[0]]), int(phase[group[0], 0]), int(phase[group[0], 1])) for group in groups], radius)
+
+            # The copies are added in batches of about 2 ** 22 pixels
+            batch = []
+            size = 0
+            for group, (sprite_x, sprite_y, sprite_coverage) in zip(groups, sprites):
+                self.count += len(group) * len(shapes[int(shape_index[group[0]])])
+                batch.append(((whole[group, 0][:, None] + sprite_x).ravel(), (whole[group, 1][:, None] + sprite_y).ravel(),
+                              np.tile(sprite_coverage, len(group))))
+                size += len(group) * len(sprite_coverage)
+                if size > 2 ** 22 or group is groups[-1]:
+                    self.add_coverage(*[np.concatenate(part) for part in zip(*batch)], touched)
+                    batch = []
+                    size = 0
+            self.blend(parse_colour(stroke), touched)
+
+    def make_sprites(self, shapes, keys, radius):
+        """
+        Sprites of the (shape, phase x, phase y) keys: pixels relative to the pixel of the position and their coverage.
+        Missing sprites are drawn together in one line_coverage call, each in its own cell of a large grid.
+        """
+        missing = list(dict.fromkeys(key for key in keys if (id(shapes), radius) + key not in self.sprites))
+        if missing:
+            # The shapes are kept, so their id is not given to another list while the sprites exist
+            if id(shapes) not in self.shapes:
+                self.shapes[id(shapes)] = (shapes, {})
+            shape_points = self.shapes[id(shapes)][1]
+            for shape in {shape for shape, _, _ in missing} - set(shape_points):
+                lines = shapes[shape]
+                shape_points[shape] = (np.concatenate(lines) * self.scale if lines else np.empty((0, 2)), [len(line) for line in lines])
+
+            extent = max((float(np.abs(shape_points[shape][0]).max(initial=0)) for shape, _, _ in missing), default=0.0)
+            cell = 2 * math.ceil(extent + radius + 2)
+            columns = 256
+            points = []
+            lengths = []
+            for number, (shape, phase_x, phase_y) in enumerate(missing):
+                shift = ((number % columns + 0.5) * cell + phase_x / PHASES, (number // columns + 0.5) * cell + phase_y / PHASES)
+                points.append(shape_points[shape][0] + shift)
+                lengths.extend(shape_points[shape][1])
+
+            # One entry per pixel of a sprite with its highest coverage
+            sprite = []
+            pixel = []
+            coverage = []
+            if lengths:
+                for pixel_x, pixel_y, part in line_coverage(np.concatenate(points).astype(np.float32), np.cumsum(lengths), radius):
+                    column, local_x = np.divmod(pixel_x.astype(np.int64), cell)
+                    row, local_y = np.divmod(pixel_y.astype(np.int64), cell)
+                    sprite.append(row * columns + column)
+                    pixel.append(local_y * cell + local_x)
+                    coverage.append(part)
+            sprite = np.concatenate(sprite) if sprite else np.empty(0, dtype=np.int64)
+            flat = sprite * cell * cell + (np.concatenate(pixel) if pixel else np.empty(0, dtype=np.int64))
+            coverage = np.concatenate(coverage) if coverage else np.empty(0, dtype=np.float32)
+            order = np.argsort(flat, kind="stable")
+            flat = flat[order]
+            starts = np.flatnonzero(np.r_[True, flat[1:] != flat[:-1]]) if len(flat) else np.empty(0, dtype=np.int64)
+            best = np.maximum.reduceat(coverage[order], starts) if len(flat) else coverage
+            flat = flat[starts]
+            sprite, local = np.divmod(flat, cell * cell)
+            bounds = np.searchsorted(sprite, np.arange(len(missing) + 1))
+            for number, key in enumerate(missing):
+                part = slice(bounds[number], bounds[number + 1])
+                local_y, local_x = np.divmod(local[part], cell)
+                self.sprites[(id(shapes), radius) + key] = (local_x - cell // 2, local_y - cell // 2, best[part])
+        return [self.sprites[(id(shapes), radius) + key] for key in keys]
+
+    def add_coverage(self, pixel_x, pixel_y, coverage, touched):
+        """Add coverage to the pixels inside the clip area, touched is extended by their rows and columns."""
+        left, top, right, bottom = self.clip
+        keep = (pixel_x >= left) & (pixel_x < right) & (pixel_y >= top) & (pixel_y < bottom)
+        if not keep.any():
+            return
+        pixel_x = pixel_x[keep]
+        pixel_y = pixel_y[keep]
+        np.maximum.at(self.coverage, pixel_y.astype(np.int64) * self.pixel_width + pixel_x, coverage[keep])
+        touched[0] = min(touched[0], int(pixel_y.min()))
+        touched[1] = min(touched[1], int(pixel_x.min()))
+        touched[2] = max(touched[2], int(pixel_y.max()) + 1)
+        touched[3] = max(touched[3], int(pixel_x.max()) + 1)
+
+    def blend(self, colour, touched):
+        """Blend the coverage buffer over the image in colour, only in the part with coverage, and clear it."""
+        top, left, bottom, right = touched
+        if top < bottom:
+            coverage = self.coverage.reshape(self.pixel_height, self.pixel_width)[top:bottom, left:right]
+            part = self.image[top:bottom, left:right]
+            part += (colour - part) * coverage[:, :, None]
+            coverage[:] = 0
@@ -1,11 +1,23 @@
 import math
 import svgwrite
 from shapely.geometry import Polygon, LineString, LinearRing
+from shapely.affinity import translate
 import numpy as np
 import random
-
-class _Segment:
-    def __init__(self, id, connection, center_x, center_y, size, draw_area, hexagon_points, lines_per_segment=5, controllpoint=2, margin=0.2):
+from functools import cached_property
+from Clip import clip_lines
+from Bezier import bernstein_basis, piece_curves
+from Instrument import instrument
+
+
+class _SegmentTemplate:
+    def __init__(self, id, connection, center_x, center_y, size, draw_area, hexagon_points, lines_per_segment=5, controllpoint=2, margin=0.2, tolerance=None):
+        """
+        Geometry of one segment, drawn once per tile variant around the origin (see _TileTemplate).
+        tolerance is the allowed distance between the drawn polylines and the exact curves in output units.
+        Without tolerance every curve is sampled with 90 points, otherwise the number of points follows
+        from the curvature and the clipped lines are simplified with Douglas-Peucker.
+        """
         self.id = id
         self.id_x, self.id_y = id
         self.connection = connection
@@ -16,6 +28,7 @@ class _Segment:
         self.lines_per_segment = lines_per_segment
         self.draw_area = draw_area
         self.margin = margin
+        self.tolerance = tolerance
         self.controllpoint = controllpoint  # Default control point for bezier curves
         self.colour_group = 0
 
@@ -24,6 +37,10 @@ class _Segment:
     
         self.draw_curve()
 
+    @cached_property
+    def curves(self):
+        """Exact sub curve (3, 2) of every piece in self.lines, only computed when curves are written."""
+        return piece_curves(self.controls, self.lines, self.piece_index)
 
     def get_erase_polygon(self):
         return self.erase_polygon
@@ -31,6 +48,29 @@ class _Segment:
     def get_lines(self):
         return self.lines
 
+    def get_curves(self):
+        return self.curves
+
+    def clip_curves(self, p0, p1, p2, lines, reverse_start):
+        """
+        Clip the sampled lines against the draw area in one call.
+        The control points (p0, p1, p2) of every curve and the curve of every clipped piece are kept for self.curves.
+        self.piece_ends gives for both ends of every piece its (edge, position) if it lies on the edge of the hexagon,
+        None if it was cut. The position is the index of the line counted from the first point of the edge,
+        with reverse_start the lines start at the far end of their first edge.
+        """
+        self.lines, self.piece_index = clip_lines(lines, self.draw_area, return_index=True, simplify=self.simplify_tolerance)
+        self.controls = np.stack([p0, p1, p2], axis=1)
+
+        index = np.arange(self.lines_per_segment)
+        reverse = self.lines_per_segment - 1 - index
+        positions = np.stack([reverse, index] if reverse_start else [index, reverse], axis=1).tolist()
+        self.piece_ends = []
+        for piece, k in zip(self.lines, self.piece_index):
+            start = (self.connection[0], positions[k][0]) if np.allclose(piece[0], p0[k], rtol=0, atol=1e-9) else None
+            end = (self.connection[1], positions[k][1]) if np.allclose(piece[-1], p2[k], rtol=0, atol=1e-9) else None
+            self.piece_ends.append((start, end))
+
     def draw_curve(self):
         connection_class = (self.connection[0]-self.connection[1]) % 6
         if connection_class == 1 or connection_class == 5:
@@ -44,31 +84,15 @@ class _Segment:
 
     def curve_neighboring_edges(self):
 
-        curves = []
-
-        for i in np.linspace(0 + self.margin, 1 - self.margin, self.lines_per_segment):
-            p0 = self.lerp_np(self.points[(self.connection[0]+1)%6], self.points[(self.connection[0]+0)%6], i)
-            p2 = self.lerp_np(self.points[(self.connection[1]+0)%6], self.points[(self.connection[1]+1)%6], i)
+        # Endpoints and control points of all lines at once
+        steps = np.linspace(0 + self.margin, 1 - self.margin, self.lines_per_segment)
+        p0 = self.lerp_batch(self.points[(self.connection[0]+1)%6], self.points[(self.connection[0]+0)%6], steps)
+        p2 = self.lerp_batch(self.points[(self.connection[1]+0)%6], self.points[(self.connection[1]+1)%6], steps)
+        center_i = self.lerp_batch(self.points[(self.connection[0]+1)%6], self.center, self.controllpoint*steps)
+        i = steps[-1]
 
-            center_i = self.lerp_np(self.points[(self.connection[0]+1)%6], self.center, self.controllpoint*i)
-
-            
-            bezier_line = LineString(self.quadratic_bezier(p0, center_i, p2))
-            clipped = bezier_line.intersection(self.draw_area)
-
-            if clipped.is_empty:
-                pass  
-            elif clipped.geom_type == 'LineString':
-                curves.append(list(clipped.coords))
-            elif clipped.geom_type == 'MultiLineString':
-                for seg in clipped.geoms:
-                    curves.append(list(seg.coords))
-            elif clipped.geom_type == 'GeometryCollection':
-                for geom in clipped.geoms:
-                    if not geom.is_empty and isinstance(geom, LineString):
-                        curves.append(list(geom.coords))
-
-        self.lines = curves
+        # Clip all curves against the draw area in one call
+        self.clip_curves(p0, center_i, p2, self.quadratic_bezier_batch(p0, center_i, p2), reverse_start=True)
 
         # Erzeuge die Kontur für das Clipping    
         contour = [self.points[(self.connection[0]+0)%6], self.points[(self.connection[0]+1)%6], self.points[(self.connection[1]+1)%6]] + self.quadratic_bezier(self.points[(self.connection[1]+1)%6],self.lerp_np(self.points[(self.connection[0]+1)%6], self.center, i*self.controllpoint+self.margin),self.points[(self.connection[0]+0)%6])
@@ -76,35 +100,19 @@ class _Segment:
         # Polygon bauen
         self.erase_polygon = Polygon(contour)
         if not self.erase_polygon.is_valid:
-            print("→ Fehlerhafte Kontur repariert mit buffer(0)")
+            instrument.count("buffer0_repairs")
             self.erase_polygon = self.erase_polygon.buffer(0)
 
     def curve_distant_edges(self):
 
-        curves = []
-
-        for i in np.linspace(0 + self.margin, 1 - self.margin, self.lines_per_segment):
-            p0 = self.lerp_np(self.points[(self.connection[0]+1)%6], self.points[(self.connection[0]+0)%6], i)
-            p2 = self.lerp_np(self.points[(self.connection[1]+0)%6], self.points[(self.connection[1]+1)%6], i)
+        # Endpoints and control points of all lines at once
+        steps = np.linspace(0 + self.margin, 1 - self.margin, self.lines_per_segment)
+        p0 = self.lerp_batch(self.points[(self.connection[0]+1)%6], self.points[(self.connection[0]+0)%6], steps)
+        p2 = self.lerp_batch(self.points[(self.connection[1]+0)%6], self.points[(self.connection[1]+1)%6], steps)
+        center_i = self.lerp_batch(self.lerp_np(self.points[(self.connection[0]+1)%6], self.points[(self.connection[1]+0)%6],0.5),self.center, (self.controllpoint-0.6)*steps+ 0.3)
 
-            center_i = self.lerp_np(self.lerp_np(self.points[(self.connection[0]+1)%6], self.points[(self.connection[1]+0)%6],0.5),self.center, (self.controllpoint-0.6)*i+ 0.3)
-
-            line = LineString(self.quadratic_bezier(p0, center_i, p2))
-            clipped = line.intersection(self.draw_area)
-
-
-            if clipped.is_empty:
-                pass  
-            elif clipped.geom_type == 'LineString':
-                curves.append(list(clipped.coords))
-            elif clipped.geom_type == 'MultiLineString':
-                curves.extend([list(seg.coords) for seg in clipped.geoms])
-            elif clipped.geom_type == 'GeometryCollection':
-                for geom in clipped.geoms:
-                    if not geom.is_empty and isinstance(geom, LineString):
-                        curves.append(list(geom.coords))
-
-        self.lines = curves
+        # Clip all curves against the draw area in one call
+        self.clip_curves(p0, center_i, p2, self.quadratic_bezier_batch(p0, center_i, p2), reverse_start=True)
 
         # Erzeuge die Kontur für das Clipping    
         contour = [self.points[(self.connection[0]+0)%6]]
@@ -124,32 +132,17 @@ class _Segment:
         # Polygon bauen
         self.erase_polygon = Polygon(contour)
         if not self.erase_polygon.is_valid:
-            print("→ Fehlerhafte Kontur repariert mit buffer(0)")
+            instrument.count("buffer0_repairs")
             self.erase_polygon = self.erase_polygon.buffer(0)
 
     def curve_opposite_edges(self):
 
-        curves = []
+        steps = np.linspace(0 + self.margin, 1-self.margin, self.lines_per_segment)
+        p0 = self.lerp_batch(self.points[(self.connection[0]+0)%6], self.points[(self.connection[0]+1)%6], steps)
+        p2 = self.lerp_batch(self.points[(self.connection[1]+1)%6], self.points[(self.connection[1]+0)%6], steps)
 
-        for i in np.linspace(0 + self.margin, 1-self.margin, self.lines_per_segment):
-            p0 = self.lerp_np(self.points[(self.connection[0]+0)%6], self.points[(self.connection[0]+1)%6], i)
-            p2 = self.lerp_np(self.points[(self.connection[1]+1)%6], self.points[(self.connection[1]+0)%6], i) 
-
-            line = LineString([p0,p2])
-            clipped = line.intersection(self.draw_area)
-            
-            if clipped.is_empty:
-                pass  
-            elif clipped.geom_type == 'LineString':
-                curves.append(list(clipped.coords))
-            elif clipped.geom_type == 'MultiLineString':
-                curves.extend([list(seg.coords) for seg in clipped.geoms])
-            elif clipped.geom_type == 'GeometryCollection':
-                for geom in clipped.geoms:
-                    if not geom.is_empty and isinstance(geom, LineString):
-                        curves.append(list(geom.coords))
-
-        self.lines = curves
+        # Clip all straight lines against the draw area in one call, as curves their control point is the middle
+        self.clip_curves(p0, (p0 + p2) / 2, p2, np.stack([p0, p2], axis=1), reverse_start=False)
 
         # Erzeuge die Kontur für das Clipping    
         contour = [self.points[(self.connection[0]+0)%6], self.points[(self.connection[0]+1)%6], self.points[(self.connection[1]+0)%6], self.points[(self.connection[1]+1)%6]]
@@ -157,18 +150,176 @@ class _Segment:
         # Polygon bauen
         self.erase_polygon = Polygon(contour)
         if not self.erase_polygon.is_valid:
-            print("→ Fehlerhafte Kontur repariert mit buffer(0)")
+            instrument.count("buffer0_repairs")
             self.erase_polygon = self.erase_polygon.buffer(0)
 
-    def quadratic_bezier(self, p0, p1, p2, num=90):
-        t = np.linspace(0, 1, num)
-        return [( (1 - tt)**2 * p0[0] + 2 * (1 - tt) * tt * p1[0] + tt**2 * p2[0],
-                (1 - tt)**2 * p0[1] + 2 * (1 - tt) * tt * p1[1] + tt**2 * p2[1]) for tt in t]
+    # Half of the tolerance is used for the sampling and half for the simplification of the clipped lines
+    @property
+    def simplify_tolerance(self):
+        return None if self.tolerance is None else self.tolerance / 2
+
+    def sample_count(self, p0, p1, p2):
+        """
+        Number of points so the chords of the curves stay within tolerance / 2 of the curves.
+        The chord error of a quadratic bezier over a parameter step h is |p0 - 2 p1 + p2| h^2 / 4,
+        for a batch of curves the most curved one decides.
+        """
+        if self.tolerance is None:
+            return 90
+        curvature = np.max(np.linalg.norm(np.asarray(p0, dtype=float) - 2 * np.asarray(p1, dtype=float) + np.asarray(p2, dtype=float), axis=-1))
+        steps = math.ceil(math.sqrt(curvature / (2 * self.tolerance)))
+        return max(steps, 1) + 1
+
+    def quadratic_bezier(self, p0, p1, p2, num=None):
+        with instrument.stage("curve_sampling"):
+            if num is None:
+                num = self.sample_count(p0, p1, p2)
+            controls = np.array([p0, p1, p2], dtype=float)
+            return list(map(tuple, (bernstein_basis(num) @ controls).tolist()))
+
+    def quadratic_bezier_batch(self, p0, p1, p2, num=None):
+        """Sample many curves at once. p0, p1, p2 have shape (lines, 2), the result (lines, num, 2)."""
+        with instrument.stage("curve_sampling"):
+            if num is None:
+                num = self.sample_count(p0, p1, p2)
+            controls = np.stack([p0, p1, p2], axis=1)
+            return bernstein_basis(num) @ controls
 
     def lerp_np(self, p0, p1, t):
         p0 = np.array(p0)
         p1 = np.array(p1)
         return tuple(p0 + t * (p1 - p0))
 
+    def lerp_batch(self, p0, p1, t):
+        """Interpolate between two points for every value of the array t, shape (len(t), 2)."""
+        p0 = np.asarray(p0, dtype=float)
+        p1 = np.asarray(p1, dtype=float)
+        return p0 + np.asarray(t, dtype=float)[:, None] * (p1 - p0)
+
+    def __repr__(self):
+        return f"Segment(id={self.id}, connection={self.connection})"
+
+
+class _Segment:
+    """
+    Segment number position of hexagon number hexagon as light view on the arrays of the grid (_HexagonArrays).
+    Nothing but the colour_group is stored per segment, the geometry is the one of the tile template
+    moved to the center of the hexagon and is computed when it is needed.
+    Views of the same segment are equal, so they can be used as keys of dicts and sets.
+    """
+    __slots__ = ("arrays", "hexagon", "position")
+
+    def __init__(self, arrays, hexagon, position):
+        self.arrays = arrays
+        self.hexagon = hexagon
+        self.position = position
+
+    @property
+    def template(self):
+        return self.arrays.template_of(self.hexagon).segments[self.position]
+
+    @property
+    def id(self):
+        return self.arrays.id[self.hexagon].tolist()
+
+    @property
+    def id_x(self):
+        return int(self.arrays.id[self.hexagon, 0])
+
+    @property
+    def id_y(self):
+        return int(self.arrays.id[self.hexagon, 1])
+
+    @property
+    def connection(self):
+        return self.arrays.connection[self.hexagon, self.position].tolist()
+
+    @property
+    def center_x(self):
+        return self.arrays.center[self.hexagon, 0]
+
+    @property
+    def center_y(self):
+        return self.arrays.center[self.hexagon, 1]
+
+    @property
+    def center(self):
+        return (self.center_x, self.center_y)
+
+    @property
+    def size(self):
+        return self.arrays.size
+
+    @property
+    def lines_per_segment(self):
+        return self.arrays.lines_per_segment
+
+    @property
+    def margin(self):
+        return self.arrays.margin
+
+    @property
+    def tolerance(self):
+        return self.arrays.tolerance
+
+    @property
+    def controllpoint(self):
+        return self.template.controllpoint
+
+    @property
+    def points(self):
+        return [(self.center_x + x, self.center_y + y) for x, y in self.arrays.template_of(self.hexagon).points]
+
+    @property
+    def colour_group(self):
+        return int(self.arrays.colour_group[self.hexagon, self.position])
+
+    @colour_group.setter
+    def colour_group(self, value):
+        self.arrays.colour_group[self.hexagon, self.position] = value
+
+    @property
+    def piece_ends(self):
+        return self.template.piece_ends
+
+    @property
+    def shift(self):
+        """Offset of the template geometry, hot loops add it to template.lines themselves instead of using lines."""
+        return self.arrays.center[self.hexagon]
+
+    @property
+    def lines(self):
+        shift = self.shift
+        return [line + shift for line in self.template.lines]
+
+    @property
+    def curves(self):
+        shift = self.shift
+        return [curve + shift for curve in self.template.curves]
+
+    # Shapely geometry is only moved when it is needed
+    @property
+    def draw_area(self):
+        return translate(self.template.draw_area, self.center_x, self.center_y)
+
+    @property
+    def erase_polygon(self):
+        return translate(self.template.erase_polygon, self.center_x, self.center_y)
+
+    def get_erase_polygon(self):
+        return self.erase_polygon
+
+    def get_lines(self):
+        return self.lines
+
+    def get_curves(self):
+        return self.curves
+
+    def __eq__(self, other):
+        return isinstance(other, _Segment) and self.arrays is other.arrays and self.hexagon == other.hexagon and self.position == other.position
+
+    def __hash__(self):
+        return hash((id(self.arrays), self.hexagon, self.position))
+
     def __repr__(self):
         return f"Segment(id={self.id}, connection={self.connection})"
\ No newline at end of file
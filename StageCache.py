@@ -0,0 +1,276 @@
+import os
+import json
+import random
+import hashlib
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from Grid import _Grid, COLORS
+from Hexagon import _HexagonList
+from HexagonArrays import _HexagonArrays
+from Colouring import _Colouring
+from StrandGraph import _StrandGraph
+from Instrument import instrument
+from SvgWriter import _SvgWriter
+
+
+# Changes with the layout of the checkpoints or the code of a stage, older checkpoints are not used
+STAGE_VERSION = 1
+
+# Parameters of _Grid each stage depends on
+TILE_OPTIONS = ["width", "height", "hex_size", "offset_x", "offset_y", "margin_width", "margin_height", "seed", "region"]
+GEOMETRY_OPTIONS = ["lines_per_segment", "hexagon_margin", "tolerance"]
+
+
+def stage_key(stage, inputs, upstream=()):
+    """Content hash of a stage from its own inputs and the hashes of the stages it is built on."""
+    data = json.dumps({"stage": stage, "version": STAGE_VERSION, "inputs": inputs, "upstream": list(upstream)}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _StageCache():
+    def __init__(self, directory="checkpoints", max_bytes=512 * 2**20):
+        """
+        Checkpoints of the render stages as npz files in directory, named by stage and content hash.
+        When the files take more than max_bytes, the least recently used ones are removed.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, stage, key):
+        return os.path.join(self.directory, f"{stage}_{key[:32]}.npz")
+
+    def load(self, stage, key):
+        """Arrays of the checkpoint as dict, None if there is none (or it can not be read)."""
+        filename = self.filename(stage, key)
+        try:
+            with np.load(filename, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, EOFError):
+            instrument.count("checkpoint_misses")
+            return None
+        # The time of the last use decides what is evicted
+        os.utime(filename)
+        instrument.count("checkpoint_hits")
+        return arrays
+
+    def store(self, stage, key, **arrays):
+        """Write the arrays as checkpoint, written next to the target and renamed so readers never see half a file."""
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                np.savez(file, **arrays)
+            os.replace(temporary, self.filename(stage, key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+
+    def size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".npz"))
+
+    def evict(self):
+        """Remove the least recently used checkpoints until the cache is not larger than max_bytes."""
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in os.scandir(self.directory) if entry.name.endswith(".npz")]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            instrument.count("checkpoints_evicted")
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                os.remove(entry.path)
+
+
+class _StagedRender():
+    def __init__(self, cache, **grid_options):
+        """
+        Render of a grid split into the stages tiles, geometry, strands, colours and export.
+        Every stage stores a checkpoint in cache (_StageCache) keyed by the hash of its inputs and of the stages
+        before, so a new render only runs the stages whose inputs changed, e.g. a new colour_count only
+        colours the strands again and a new palette only writes the files again.
+        grid_options are passed to _Grid. Without seed the tiles are drawn from the random module in the state
+        it has when the render is created, that state is part of the key of the tiles.
+        self.report holds "hit" or "miss" for every stage of the last render.
+        """
+        self.cache = cache
+        self.grid_options = grid_options
+        self.random_state = random.getstate() if grid_options.get("seed") is None else None
+        self.grid = None
+        self.report = {}
+
+    def cached(self, stage, key, compute):
+        """Arrays of a stage from its checkpoint, or computed by compute() and stored."""
+        arrays = self.cache.load(stage, key)
+        self.report[stage] = "miss" if arrays is None else "hit"
+        if arrays is None:
+            with instrument.stage(stage):
+                arrays = compute()
+            self.cache.store(stage, key, **arrays)
+        return arrays
+
+    def tiles(self):
+        """Tile of every hexagon in the draw area: id, center, offset, pattern, connection and on_border."""
+        inputs = {name: self.grid_options.get(name) for name in TILE_OPTIONS}
+        if self.random_state is not None:
+            inputs["random_state"] = hashlib.sha256(repr(self.random_state).encode()).hexdigest()
+        key = stage_key("tiles", inputs)
+
+        def compute():
+            if self.random_state is not None:
+                random.setstate(self.random_state)
+            self.grid = _Grid(**self.grid_options)
+            hexagons = self.grid.hexagons
+            count = len(hexagons)
+            return {name: getattr(hexagons, name)[:count] for name in ("id", "center", "offset", "pattern", "connection", "on_border")}
+
+        return key, self.cached("tiles", key, compute)
+
+    def grid_from_tiles(self, tiles):
+        """The grid of the tiles of a checkpoint, built without drawing tiles again."""
+        if self.grid is None:
+            grid = _Grid(**self.grid_options, streaming=True)
+            grid.hexagons = _HexagonArrays(grid.hex_size, grid.lines_per_segment, grid.hexagon_margin, grid.tolerance, capacity=len(tiles["id"]))
+            for id, center, offset, pattern, connection, on_border in zip(tiles["id"].tolist(), tiles["center"].tolist(), tiles["offset"].tolist(),
+                                                                           tiles["pattern"].tolist(), tiles["connection"].tolist(), tiles["on_border"].tolist()):
+                grid.hexagons.append(center[0], center[1], id, (offset, pattern, connection), on_border=on_border)
+            grid.grid = _HexagonList(grid.hexagons)
+            self.grid = grid
+        return self.grid
+
+    def geometry(self, tiles_key, tiles, curves=False):
+        """Clipped lines of all segments: coords, offsets of the lines in coords and the segment (3 * hexagon + position) of every line."""
+        inputs = {name: self.grid_options.get(name) for name in GEOMETRY_OPTIONS}
+        inputs["curves"] = curves
+        key = stage_key("geometry", inputs, [tiles_key])
+
+        def compute():
+            lines = []
+            segment_index = []
+            for segment, pieces in self.grid_from_tiles(tiles).clip_segments(curves=curves):
+                lines.extend(pieces)
+                segment_index.extend([3 * segment.hexagon + segment.position] * len(pieces))
+            offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(line) for line in lines])
+            coords = np.concatenate(lines).astype(np.float64) if lines else np.empty((0, 2))
+            return {"coords": coords, "offsets": offsets, "segment": np.array(segment_index, dtype=np.int64)}
+
+        return key, self.cached("geometry", key, compute)
+
+    def strands(self, tiles_key, tiles):
+        """Strand of every segment in the order the strands first appear, and the conflicts (a, b, weight) between strands."""
+        key = stage_key("strands", {}, [tiles_key])
+
+        def compute():
+            colouring = _Colouring(self.grid_from_tiles(tiles).grid, mode=None)
+            groups = colouring.segment_group_list
+            strand = np.zeros(3 * len(tiles["id"]), dtype=np.int64)
+            for position, group in enumerate(groups):
+                for segment in group.segments:
+                    strand[3 * segment.hexagon + segment.position] = position
+            graph = _StrandGraph.from_hexagon_ids([group.hexagon_ids for group in groups])
+            conflicts = [(a, b, weight) for a, neighbours in enumerate(graph.neighbours) for b, weight in neighbours.items() if a < b]
+            return {"strand": strand, "count": np.array(len(groups)), "conflicts": np.array(conflicts, dtype=np.int64).reshape(-1, 3)}
+
+        return key, self.cached("strands", key, compute)
+
+    def colours(self, strands_key, strands, colour_count=5, mode="greedy"):
+        """Colour of every strand from the strand graph, like _Colouring."""
+        key = stage_key("colours", {"colour_count": colour_count, "mode": mode}, [strands_key])
+
+        def compute():
+            graph = _StrandGraph(int(strands["count"]))
+            for a, b, weight in strands["conflicts"].tolist():
+                graph.add_conflict(a, b, weight)
+            return {"colour": np.array(graph.colour(colour_count, mode), dtype=np.int64).reshape(-1)}
+
+        return key, self.cached("colours", key, compute)
+
+    def export(self, inputs, upstream, files, write):
+        """
+        Run write() unless the checkpoint of the same inputs lists files that are all still there unchanged.
+        The checkpoint keeps the digest of every written file.
+        """
+        key = stage_key("export", dict(inputs, files=files), upstream)
+        arrays = self.cache.load("export", key)
+        if arrays is not None and all(os.path.exists(file) for file in arrays["files"].tolist()) and \
+                [file_digest(file) for file in arrays["files"].tolist()] == arrays["digests"].tolist():
+            self.report["export"] = "hit"
+            return arrays["files"].tolist()
+        self.report["export"] = "miss"
+        with instrument.stage("export"):
+            written = write()
+        self.cache.store("export", key, files=np.array(written), digests=np.array([file_digest(file) for file in written]))
+        return written
+
+    def draw_one_colour(self, encoding="polyline", precision=2, compress=False, name="hexagon_one_colour"):
+        """Svg with every segment in one colour like _Grid.draw_grid_one_colour, returns the written file."""
+        self.report = {}
+        tiles_key, tiles = self.tiles()
+        geometry_key, geometry = self.geometry(tiles_key, tiles, curves=encoding == "bezier")
+        suffix = ".svgz" if compress else ".svg"
+        width, height, background = self.grid_options["width"], self.grid_options["height"], self.grid_options.get("background", True)
+
+        def write():
+            lines = np.split(geometry["coords"], geometry["offsets"][1:-1]) if len(geometry["segment"]) else []
+            with _SvgWriter(name + suffix, width, height, background=background, encoding=encoding, precision=precision) as svg:
+                svg.write_lines(lines, stroke='white', stroke_width=0.5)
+            return [name + suffix]
+
+        inputs = {"kind": "one_colour", "background": background, "encoding": encoding, "precision": precision}
+        return self.export(inputs, [geometry_key], [name + suffix], write)[0]
+
+    def draw_coloured(self, encoding="polyline", precision=2, compress=False, name="hexagon_obj_coloured", colour_count=5, mode="greedy", colors=COLORS, workers=None):
+        """
+        Coloured svg and one svg per colour like _Grid.draw_grid_coloured (without layers, join and plot_order),
+        colors is the stroke of every colour group. Returns the written files.
+        """
+        self.report = {}
+        tiles_key, tiles = self.tiles()
+        geometry_key, geometry = self.geometry(tiles_key, tiles, curves=encoding == "bezier")
+        strands_key, strands = self.strands(tiles_key, tiles)
+        colours_key, colours = self.colours(strands_key, strands, colour_count, mode)
+        suffix = ".svgz" if compress else ".svg"
+        width, height, background = self.grid_options["width"], self.grid_options["height"], self.grid_options.get("background", True)
+        options = dict(background=background, encoding=encoding, precision=precision)
+
+        # Colour of every line: segment -> strand -> colour
+        line_colour = colours["colour"][strands["strand"][geometry["segment"]]]
+        used = [id_val for id_val in range(0,11) if np.any(line_colour == id_val)]
+        files = [name + suffix] + [f"{name}_{id_val}" + suffix for id_val in used]
+
+        def write():
+            lines = np.split(geometry["coords"], geometry["offsets"][1:-1]) if len(line_colour) else []
+            lines_by_colour = {id_val: [lines[k] for k in np.flatnonzero(line_colour == id_val)] for id_val in used}
+            with _SvgWriter(name + suffix, width, height, **options) as svg:
+                for id_val in range(0,11):
+                    color = colors[id_val] if id_val < len(colors) else 'black'
+                    svg.write_lines(lines_by_colour.get(id_val, []), stroke=color, stroke_width=0.5)
+
+            def draw_colour(id_val):
+                color = colors[id_val] if id_val < len(colors) else 'black'
+                with _SvgWriter(f"{name}_{id_val}" + suffix, width, height, **options) as svg:
+                    svg.write_lines(lines_by_colour[id_val], stroke=color, stroke_width=0.5)
+                return f"{name}_{id_val}" + suffix
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return [name + suffix] + list(executor.map(draw_colour, used))
+
+        inputs = {"kind": "coloured", "background": background, "encoding": encoding, "precision": precision, "colors": list(colors)}
+        return self.export(inputs, [geometry_key, strands_key, colours_key], files, write)
@@ -0,0 +1,137 @@
+import heapq
+import numpy as np
+from Instrument import instrument
+
+
+def merge_smallest_overlap(overlap, colour_count, merge):
+    """
+    Merge the two classes with the smallest overlap until colour_count classes are left.
+    overlap is the symmetric class x class matrix with inf on the diagonal, merge(a, b) merges class b into a.
+    Overlaps add up, so after a merge only the row and column of the merged class change.
+    """
+    while len(overlap) > max(colour_count, 1):
+        # First pair with the smallest overlap, like scanning all pairs in order
+        a, b = np.unravel_index(np.argmin(overlap), overlap.shape)
+        merge(a, b)
+        instrument.count("merge_iterations")
+
+        overlap[a] += overlap[b]
+        overlap[:, a] = overlap[a]
+        overlap = np.delete(np.delete(overlap, b, axis=0), b, axis=1)
+    return overlap
+
+
+class _StrandGraph():
+    def __init__(self, count=0):
+        """
+        Compact conflict graph of strands 0 .. count-1. Two strands are connected if they share a hexagon,
+        the weight is the number of their segment pairs in common hexagons.
+        Only the graph is needed to colour the strands, not the geometry.
+        """
+        self.neighbours = [dict() for _ in range(count)]
+
+    def add_strand(self):
+        """Add a strand without conflicts and return its number."""
+        self.neighbours.append(dict())
+        return len(self.neighbours) - 1
+
+    def add_conflict(self, a, b, weight=1):
+        if a == b:
+            return
+        self.neighbours[a][b] = self.neighbours[a].get(b, 0) + weight
+        self.neighbours[b][a] = self.neighbours[b].get(a, 0) + weight
+
+    @classmethod
+    def from_hexagon_ids(cls, hexagon_counters):
+        """Graph of strands given by one Counter of segments per hexagon id for each strand."""
+        graph = cls(len(hexagon_counters))
+        strands_per_hexagon = {}
+        for strand, counter in enumerate(hexagon_counters):
+            for hexagon_id, count in counter.items():
+                strands_per_hexagon.setdefault(hexagon_id, []).append((strand, count))
+
+        for strands in strands_per_hexagon.values():
+            for position, (a, count_a) in enumerate(strands):
+                for b, count_b in strands[position + 1:]:
+                    graph.add_conflict(a, b, count_a * count_b)
+        return graph
+
+    def __len__(self):
+        return len(self.neighbours)
+
+    def greedy_classes(self):
+        """Place every strand in order in the first class without a conflict."""
+        classes = []
+        class_of = {}
+        for strand, neighbours in enumerate(self.neighbours):
+            used = {class_of[other] for other in neighbours if other in class_of}
+            position = 0
+            while position in used:
+                position += 1
+            if position == len(classes):
+                classes.append([])
+            classes[position].append(strand)
+            class_of[strand] = position
+        return classes
+
+    def dsatur_classes(self):
+        """Colour the graph with the DSatur heuristic and return the strands per colour."""
+        colours = [None] * len(self.neighbours)
+        neighbour_colours = [set() for _ in self.neighbours]
+
+        # Always colour the strand with the most differently coloured neighbours next, ties by degree
+        heap = [(0, -len(neighbours), strand) for strand, neighbours in enumerate(self.neighbours)]
+        heapq.heapify(heap)
+        while heap:
+            _, _, strand = heapq.heappop(heap)
+            if colours[strand] is not None:
+                continue
+            colour = 0
+            while colour in neighbour_colours[strand]:
+                colour += 1
+            colours[strand] = colour
+
+            for other in self.neighbours[strand]:
+                if colours[other] is None and colour not in neighbour_colours[other]:
+                    neighbour_colours[other].add(colour)
+                    heapq.heappush(heap, (-len(neighbour_colours[other]), -len(self.neighbours[other]), other))
+
+        classes = [[] for _ in range(max(colours, default=-1) + 1)]
+        for strand, colour in enumerate(colours):
+            classes[colour].append(strand)
+        return classes
+
+    def merge_classes(self, classes, colour_count):
+        """Merge the classes with the smallest overlap until colour_count classes are left."""
+        classes = [list(strands) for strands in classes]
+        class_of = {strand: position for position, strands in enumerate(classes) for strand in strands}
+
+        overlap = np.zeros((len(classes), len(classes)))
+        for strand, neighbours in enumerate(self.neighbours):
+            for other, weight in neighbours.items():
+                if strand < other and class_of[strand] != class_of[other]:
+                    overlap[class_of[strand], class_of[other]] += weight
+                    overlap[class_of[other], class_of[strand]] += weight
+        np.fill_diagonal(overlap, np.inf)
+
+        def merge(a, b):
+            classes[a].extend(classes[b])
+            del classes[b]
+
+        merge_smallest_overlap(overlap, colour_count, merge)
+        return classes
+
+    def colour(self, colour_count=5, mode="greedy"):
+        """Colour of every strand, with at most colour_count colours."""
+        if mode == "greedy":
+            classes = self.greedy_classes()
+        elif mode == "dsatur":
+            classes = self.dsatur_classes()
+        else:
+            raise ValueError("Ungültiger Wert!")
+
+        colours = [0] * len(self.neighbours)
+        for position, strands in enumerate(self.merge_classes(classes, colour_count)):
+            for strand in strands:
+                colours[strand] = position
+        return colours
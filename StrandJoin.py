@@ -0,0 +1,80 @@
+import numpy as np
+from Neighbours import neighbour_edge
+
+
+def join_strands(clipped, group_of, lines_per_segment):
+    """
+    Chain the clipped pieces of connected segments into continuous lines.
+    clipped is the result of _Grid.clip_segments(return_index=True), group_of the strand group of every
+    segment (_Colouring.group_of), only pieces of the same strand group are joined.
+    Two pieces meet where both end uncut on the same edge with the same line index, seen from the
+    neighbouring hexagon the edge runs the other way, so the index there is lines_per_segment - 1 - index.
+    Returns (colour_group, line) for every joined line, ordered by the first piece of each line.
+    The lines of closed strands end with their first point.
+    """
+    pieces = []  # (segment, piece) in drawing order
+    ends = []  # Slot (id_x, id_y, edge, position) of the start and end of every piece, None if it was cut
+    slots = {}
+    for segment, segment_pieces, index in clipped:
+        lines = segment.template.lines
+        shift = segment.shift
+        for piece, j in zip(segment_pieces, index):
+            piece_ends = []
+            for end, (slot, point, line_point) in enumerate(zip(segment.piece_ends[j], (piece[0], piece[-1]), (lines[j][0] + shift, lines[j][-1] + shift))):
+                # The end is only on the edge if the page clipping did not cut it away
+                if slot is None or not np.allclose(point, line_point, rtol=0, atol=1e-9):
+                    piece_ends.append(None)
+                    continue
+                key = (segment.id_x, segment.id_y) + tuple(slot)
+                slots[key] = (len(pieces), end)
+                piece_ends.append(key)
+            pieces.append((segment, piece))
+            ends.append(piece_ends)
+
+    # Link every end to the end of the piece on the other side of its edge
+    links = [[None, None] for _ in pieces]
+    for position, piece_ends in enumerate(ends):
+        for end, key in enumerate(piece_ends):
+            if key is None:
+                continue
+            id_x, id_y, edge, line = key
+            other = slots.get(neighbour_edge(id_x, id_y, edge) + (lines_per_segment - 1 - line,))
+            if other is not None and group_of[pieces[position][0]] is group_of[pieces[other[0]][0]]:
+                links[position][end] = other
+
+    visited = [False] * len(pieces)
+
+    def walk(first, entry):
+        """
+        Follow the links from piece first, entered at its end entry, until a free end or back to first.
+        Returns the smallest piece position of the line and the line.
+        """
+        chain = []
+        order = first
+        position = first
+        while True:
+            visited[position] = True
+            order = min(order, position)
+            piece = pieces[position][1]
+            chain.append(piece if entry == 0 else piece[::-1])
+            link = links[position][1 - entry]
+            if link is None or link[0] == first:
+                break
+            position, entry = link
+        line = np.vstack([chain[0]] + [piece[1:] for piece in chain[1:]])
+        if link is not None:
+            line[-1] = line[0]
+        return order, line
+
+    joined = []
+    # Open strands start at a free end, the pieces left afterwards belong to closed strands
+    for position in range(len(pieces)):
+        if not visited[position] and None in links[position]:
+            joined.append(walk(position, links[position].index(None)))
+    for position in range(len(pieces)):
+        if not visited[position]:
+            joined.append(walk(position, 0))
+
+    # The walk does not always start at the first piece of a line
+    joined.sort(key=lambda item: item[0])
+    return [(pieces[position][0].colour_group, line) for position, line in joined]
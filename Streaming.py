@@ -0,0 +1,182 @@
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from Grid import COLORS
+from Colouring import _Colouring
+from DisjointSet import _DisjointSet
+from StrandGraph import _StrandGraph
+from Neighbours import neighbour_edge
+from Instrument import instrument
+from SvgWriter import _SvgWriter
+
+
+class _LineSpill():
+    def __init__(self, directory=None):
+        """Temporary file the lines of a band and a label per line are appended to, read back band by band."""
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.records = 0
+        self.lines = 0
+
+    def append(self, lines, labels):
+        if not lines:
+            return
+        lengths = np.array([len(line) for line in lines], dtype=np.int64)
+        coords = np.concatenate(lines).astype(np.float64)
+        self.file.write(np.array([len(lines), len(coords)], dtype=np.int64).tobytes())
+        self.file.write(lengths.tobytes())
+        self.file.write(np.asarray(labels, dtype=np.int64).tobytes())
+        self.file.write(coords.tobytes())
+        self.records += 1
+        self.lines += len(lines)
+
+    def __iter__(self):
+        """Generator over (lines, labels) of the appended bands, the lines are views on the coordinates of their band."""
+        self.file.flush()
+        self.file.seek(0)
+        for _ in range(self.records):
+            count, points = np.frombuffer(self.file.read(16), dtype=np.int64)
+            lengths = np.frombuffer(self.file.read(8 * count), dtype=np.int64)
+            labels = np.frombuffer(self.file.read(8 * count), dtype=np.int64)
+            coords = np.frombuffer(self.file.read(16 * points), dtype=np.float64).reshape(-1, 2)
+            yield np.split(coords, np.cumsum(lengths)[:-1]), labels
+
+    def iter_lines(self):
+        for lines, _ in self:
+            yield from lines
+
+    def close(self):
+        self.file.close()
+
+
+class _StreamingRender():
+    def __init__(self, grid, band_rows=8, spill_directory=None):
+        """
+        Render a grid created with streaming=True band by band of band_rows hexagon rows.
+        Only one band of hexagons and the open strand ends towards the next rows are kept, so the memory
+        depends on the width of the canvas and not on its area. The strands of a band are grouped like in
+        _Colouring and joined to the strands of the bands before over a union-find of strand labels.
+        For coloured files the clipped lines are written to a temporary spill file in spill_directory,
+        the colours come from the compact strand graph alone.
+        Without seed the tiles are drawn from the random module while rendering, so seed it right before.
+        """
+        self.grid = grid
+        self.band_rows = band_rows
+        self.spill_directory = spill_directory
+
+    def draw_one_colour(self, encoding="polyline", precision=2, compress=False, name="hexagon_one_colour"):
+        """Svg with every segment in one colour like _Grid.draw_grid_one_colour, the lines of a band are written as soon as it is generated."""
+        grid = self.grid
+        curves = encoding == "bezier"
+        suffix = ".svgz" if compress else ".svg"
+
+        # One generator for all bands, so the writer puts all lines in one group like draw_grid_one_colour
+        lines = (line for band in grid.iter_bands(self.band_rows) for line in grid.clip_to_page(hexagons=band, curves=curves))
+        with _SvgWriter(name + suffix, grid.width, grid.height, background=grid.background, encoding=encoding, precision=precision, compress=compress) as svg:
+            svg.write_lines(lines, stroke='white', stroke_width=0.5)
+        return name + suffix
+
+    def group_bands(self, spill, curves=False):
+        """
+        Generate all bands, group their strands and append their clipped lines with the strand label of every line to spill.
+        Returns (strands, conflicts): the union-find of the strand labels and the conflicts (a, b, weight) between labels.
+        Labels are given in the order the strands first appear in the grid.
+        """
+        grid = self.grid
+        strands = _DisjointSet()
+        conflicts = []
+        frontier = {}  # (id_x, id_y, edge) -> label of the open ends facing rows that are not generated yet
+        for band in grid.iter_bands(self.band_rows):
+            with instrument.stage("stream_grouping"):
+                colouring = _Colouring(band, mode=None)
+                groups = colouring.segment_group_list
+                labels = {group: strands.add() for group in groups}
+
+                graph = _StrandGraph.from_hexagon_ids([group.hexagon_ids for group in groups])
+                first = labels[groups[0]] if groups else 0
+                conflicts.extend((first + a, first + b, weight) for a, neighbours in enumerate(graph.neighbours) for b, weight in neighbours.items() if a < b)
+
+                # Open ends meet the open ends of the bands before, the ends towards later rows wait on the frontier
+                last_row = int(band.arrays.id[:len(band), 1].max())
+                for id_x, id_y, edge, segment in colouring.open_edges:
+                    label = labels[colouring.group_of[segment]]
+                    other = frontier.pop(neighbour_edge(id_x, id_y, edge), None)
+                    if other is not None:
+                        strands.union(label, other)
+                    elif neighbour_edge(id_x, id_y, edge)[1] > last_row:
+                        frontier[(id_x, id_y, edge)] = label
+                # Ends whose neighbour row is done without a hexagon there stay open for good
+                frontier = {key: label for key, label in frontier.items() if neighbour_edge(*key)[1] > last_row}
+            instrument.set("stream_frontier", len(frontier))
+
+            lines = []
+            line_labels = []
+            for segment, pieces in grid.clip_segments(hexagons=band, curves=curves):
+                lines.extend(pieces)
+                line_labels.extend([labels[colouring.group_of[segment]]] * len(pieces))
+            with instrument.stage("stream_spill"):
+                spill.append(lines, line_labels)
+            instrument.count("hexagons", len(band))
+        return strands, conflicts
+
+    def colour_strands(self, strands, conflicts, colour_count=5, mode="greedy"):
+        """Colour of every strand label from the strand graph of the joined strands, like in _Colouring."""
+        # Joined strands in the order they first appear, the first label of a strand is its smallest
+        root = np.array([strands.find(label) for label in range(len(strands))], dtype=np.int64)
+        roots, first = np.unique(root, return_index=True)
+        order = roots[np.argsort(first)]
+        number = np.empty(len(strands), dtype=np.int64)
+        number[order] = np.arange(len(order))
+
+        graph = _StrandGraph(len(order))
+        for a, b, weight in conflicts:
+            graph.add_conflict(int(number[root[a]]), int(number[root[b]]), weight)
+        colours = np.array(graph.colour(colour_count, mode), dtype=np.int64).reshape(-1)
+        return colours[number[root]]
+
+    def draw_coloured(self, encoding="polyline", precision=2, compress=False, name="hexagon_obj_coloured", colour_count=5, mode="greedy", workers=None):
+        """
+        Coloured svg and the svg per colour like _Grid.draw_grid_coloured (without layers, join and plot_order,
+        which need all lines at once). The clipped lines are spilled to a temporary file in the first pass,
+        sorted into one spill per colour after colouring and copied into the files from there. Returns the written files.
+        """
+        grid = self.grid
+        suffix = ".svgz" if compress else ".svg"
+        options = dict(background=grid.background, encoding=encoding, precision=precision, compress=compress)
+
+        spill = _LineSpill(self.spill_directory)
+        colour_spills = {}
+        try:
+            strands, conflicts = self.group_bands(spill, curves=encoding == "bezier")
+            with instrument.stage("colouring"):
+                colour_of = self.colour_strands(strands, conflicts, colour_count, mode)
+            del strands, conflicts
+
+            with instrument.stage("stream_spill"):
+                for lines, labels in spill:
+                    colours = colour_of[labels]
+                    for id_val in np.unique(colours).tolist():
+                        if id_val not in colour_spills:
+                            colour_spills[id_val] = _LineSpill(self.spill_directory)
+                        index = np.flatnonzero(colours == id_val)
+                        colour_spills[id_val].append([lines[k] for k in index], labels[index])
+            spill.close()
+
+            with _SvgWriter(name + suffix, grid.width, grid.height, **options) as svg:
+                for id_val in range(0,11):
+                    color = COLORS[id_val] if id_val < len(COLORS) else 'black'
+                    if id_val in colour_spills:
+                        svg.write_lines(colour_spills[id_val].iter_lines(), stroke=color, stroke_width=0.5)
+
+            # Save a seprate SVG for each colour group
+            def draw_colour(id_val):
+                color = COLORS[id_val] if id_val < len(COLORS) else 'black'
+                with _SvgWriter(f"{name}_{id_val}" + suffix, grid.width, grid.height, **options) as svg:
+                    svg.write_lines(colour_spills[id_val].iter_lines(), stroke=color, stroke_width=0.5)
+                return f"{name}_{id_val}" + suffix
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return [name + suffix] + list(executor.map(draw_colour, [id_val for id_val in range(0,11) if id_val in colour_spills]))
+        finally:
+            spill.close()
+            for colour_spill in colour_spills.values():
+                colour_spill.close()
@@ -0,0 +1,160 @@
+import os
+import gzip
+import shutil
+import numpy as np
+from functools import lru_cache
+from Instrument import instrument
+
+
+@lru_cache(maxsize=4096)
+def points_format(count):
+    """Format string for the points attribute of a polyline with count points."""
+    return " ".join(["%r,%r"] * count)
+
+
+@lru_cache(maxsize=4096)
+def steps_format(count):
+    """Format string for count relative steps of integer path data."""
+    return " ".join(["%d %d"] * count)
+
+
+def polyline_element(line, stroke="white", stroke_width=0.5):
+    """Svg element of one line, the coordinates of the (n, 2) array are formatted in one step."""
+    points = points_format(len(line)) % tuple(line.ravel().tolist())
+    return f'<polyline fill="none" points="{points}" stroke="{stroke}" stroke-width="{stroke_width}" />'
+
+
+class _SvgWriter():
+    def __init__(self, filename, width, height, size=("210mm", "297mm"), background=True, skip_empty=False, main_group=True, min_x=0, min_y=0, encoding="polyline", precision=2, compress=False, fragment=False):
+        """
+        Write a svg file element by element instead of building a svgwrite Drawing in memory.
+        Use it as context manager, polylines are written to the file as soon as they are passed in.
+        With skip_empty the file is removed again if no polyline was written.
+        Without main_group the lines are expected in layers (open_layer / close_layer).
+        min_x, min_y, width and height give the viewBox, e.g. of one tile of a larger drawing.
+        encoding "path" writes <path> elements with coordinates rounded to precision decimals as integers
+        and relative steps, the styling is written once on the group of each write_lines call.
+        encoding "bezier" writes the same paths, but every line is the (3, 2) control points of a quadratic bezier.
+        With compress (or a .svgz filename) the file is written as gzip stream.
+        With fragment only the elements are written, without header, background and main group,
+        so the fragment can be copied into other files with write_fragment.
+        """
+        self.filename = filename
+        self.min_x = min_x
+        self.min_y = min_y
+        self.width = width
+        self.height = height
+        self.size = size
+        self.background = background
+        self.skip_empty = skip_empty
+        self.main_group = main_group
+        self.encoding = encoding
+        self.precision = precision
+        self.compress = compress or filename.endswith(".svgz")
+        self.fragment = fragment
+        self.count = 0
+        self.vertices = 0
+        self.file = None
+
+    def __enter__(self):
+        if self.compress:
+            self.file = gzip.open(self.filename, "wt", encoding="utf-8", compresslevel=6)
+        else:
+            self.file = open(self.filename, "w", encoding="utf-8")
+        if self.fragment:
+            return self
+        self.file.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        self.file.write(f'<svg baseProfile="full" height="{self.size[1]}" version="1.1" viewBox="{self.min_x} {self.min_y} {self.width} {self.height}" width="{self.size[0]}" '
+                        'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" xmlns:xlink="http://www.w3.org/1999/xlink"'
+                        + ('' if self.main_group else ' xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"') + '><defs />')
+
+        # Background
+        if self.background:
+            self.file.write(f'<rect fill="black" height="100%" width="100%" x="{self.min_x}" y="{self.min_y}" />')
+        if self.main_group:
+            self.file.write("<g>")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.fragment:
+            self.file.write("</g></svg>" if self.main_group else "</svg>")
+        self.file.close()
+        if self.skip_empty and self.count == 0:
+            os.remove(self.filename)
+        return False
+
+    def write_fragment(self, filename, count=0):
+        """Copy the elements of a fragment file (written with fragment=True) into the file, count is its number of elements."""
+        with open(filename, encoding="utf-8") as fragment:
+            shutil.copyfileobj(fragment, self.file)
+        self.count += count
+
+    def open_layer(self, id, label):
+        """Start a named layer (an inkscape layer group)."""
+        self.file.write(f'<g id="{id}" inkscape:groupmode="layer" inkscape:label="{label}">')
+
+    def close_layer(self):
+        self.file.write("</g>")
+
+    def write_polylines(self, lines, stroke="white", stroke_width=0.5):
+        """Write every line of an iterable (e.g. a generator) as polyline."""
+        write = self.file.write
+        for line in lines:
+            write(polyline_element(line, stroke, stroke_width))
+            self.count += 1
+            self.vertices += len(line)
+
+    def path_data(self, line):
+        """Path data of one line: absolute start and relative steps in units of 10^-precision, repeated points removed."""
+        quantized = np.rint(line * 10 ** self.precision).astype(np.int64)
+        steps = np.diff(quantized, axis=0)
+        steps = steps[steps.any(axis=1)]
+        if len(steps) == 0:
+            return None
+        data = "M%d %dl" % (quantized[0, 0], quantized[0, 1]) + steps_format(len(steps)) % tuple(steps.ravel().tolist())
+        return data.replace(" -", "-")
+
+    def curve_data(self, curve):
+        """
+        Path data of quadratic beziers given as points (p0, c1, p1, c2, p2, ...), one or a chain of curves:
+        absolute start and the control and end point of every curve relative to its start, like path_data.
+        """
+        quantized = np.rint(curve * 10 ** self.precision).astype(np.int64)
+        steps = np.stack([quantized[1::2] - quantized[:-1:2], quantized[2::2] - quantized[:-1:2]], axis=1)
+        if not steps.any():
+            return None
+        data = "M%d %dq" % (quantized[0, 0], quantized[0, 1]) + steps_format(2 * len(steps)) % tuple(steps.ravel().tolist())
+        return data.replace(" -", "-")
+
+    def write_paths(self, lines, stroke="white", stroke_width=0.5):
+        """Write every line (or bezier curve) as path in a group that holds the styling and scales the integer coordinates back."""
+        scale = 10 ** self.precision
+        write = self.file.write
+        line_data = self.curve_data if self.encoding == "bezier" else self.path_data
+        group_open = False
+        for line in lines:
+            data = line_data(line)
+            if data is None:
+                continue
+            # The group is only started with its first path, so no empty groups are written
+            if not group_open:
+                write(f'<g fill="none" stroke="{stroke}" stroke-width="{stroke_width * scale:g}" transform="scale({1 / scale:g})">')
+                group_open = True
+            write(f'<path d="{data}"/>')
+            self.count += 1
+            self.vertices += len(line)
+        if group_open:
+            write("</g>")
+
+    def write_lines(self, lines, stroke="white", stroke_width=0.5):
+        """Write the lines in the encoding of the writer."""
+        count, vertices = self.count, self.vertices
+        with instrument.stage("serialization"):
+            if self.encoding == "polyline":
+                self.write_polylines(lines, stroke, stroke_width)
+            elif self.encoding in ("path", "bezier"):
+                self.write_paths(lines, stroke, stroke_width)
+            else:
+                raise ValueError("Ungültiger Wert!")
+        instrument.count("elements_emitted", self.count - count)
+        instrument.count("vertices_emitted", self.vertices - vertices)
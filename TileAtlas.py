@@ -0,0 +1,275 @@
+import os
+import json
+import math
+import hashlib
+import itertools
+import tempfile
+from functools import cached_property
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from Hexagon import _Hexagon
+from TileCache import _TileTemplate
+from Bezier import piece_curves
+
+
+# Changes with the file layout or the geometry code, older files are rebuilt
+ATLAS_VERSION = 1
+MAGIC = b"TRUCHET-ATLAS\x00\x00\x00"
+ALIGN = 64
+
+
+def atlas_config(size, lines_per_segment=5, margin=0.2, tolerance=None):
+    """Configuration an atlas is built for, in a form that is written to its header."""
+    return {"version": ATLAS_VERSION, "size": float(size), "lines_per_segment": int(lines_per_segment),
+            "margin": float(margin), "tolerance": None if tolerance is None else float(tolerance)}
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def atlas_connections():
+    """Every connection order a tile can have: 6 offsets, 5 patterns and the 6 orders of the three pairs."""
+    connections = {}
+    for offset in range(6):
+        for pattern in range(1, 6):
+            for order in itertools.permutations(_Hexagon.tile_connection(offset, pattern)):
+                connections[tuple(tuple(pair) for pair in order)] = None
+    return list(connections)
+
+
+def build_atlas(filename, size, lines_per_segment=5, margin=0.2, tolerance=None):
+    """
+    Build the templates of all tile variants of one configuration and write them to filename.
+    The file is written next to the target and renamed at the end, so readers never see a half written atlas.
+    """
+    config = atlas_config(size, lines_per_segment, margin, tolerance)
+    connections = atlas_connections()
+
+    lines = []
+    piece_index = []
+    piece_ends = []
+    controls = []
+    segment_lines = [0]
+    segment_controls = [0]
+    polygons = []
+    for connection in connections:
+        template = _TileTemplate([list(pair) for pair in connection], size, lines_per_segment, margin, tolerance)
+        for segment in template.segments:
+            lines.extend(segment.lines)
+            piece_index.extend(segment.piece_index)
+            piece_ends.extend([[-1, -1] if end is None else list(end) for ends in segment.piece_ends for end in ends])
+            controls.append(segment.controls)
+            segment_lines.append(len(lines))
+            segment_controls.append(segment_controls[-1] + len(segment.controls))
+            polygons.extend([segment.draw_area, segment.erase_polygon])
+        polygons.append(template.draw_area)
+
+    line_offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    line_offsets[1:] = np.cumsum([len(line) for line in lines])
+    wkb = [shapely.to_wkb(polygon) for polygon in polygons]
+    wkb_offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    wkb_offsets[1:] = np.cumsum([len(data) for data in wkb])
+    arrays = {
+        "connections": np.array(connections, dtype=np.int8),
+        "coords": np.concatenate(lines).astype(np.float64),
+        "line_offsets": line_offsets,
+        "piece_index": np.array(piece_index, dtype=np.int32),
+        "piece_ends": np.array(piece_ends, dtype=np.int16).reshape(-1, 4),
+        "controls": np.concatenate(controls).astype(np.float64),
+        "segment_lines": np.array(segment_lines, dtype=np.int64),
+        "segment_controls": np.array(segment_controls, dtype=np.int64),
+        "wkb": np.frombuffer(b"".join(wkb), dtype=np.uint8),
+        "wkb_offsets": wkb_offsets,
+    }
+
+    # Header: magic, length of the json part, json with the config and the position of every array
+    table = {}
+    position = 0
+    for name, array in arrays.items():
+        table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+        position += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"config": config, "hash": config_hash(config), "arrays": table}).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(MAGIC)
+            file.write(len(header).to_bytes(8, "little"))
+            file.write(header)
+            for name, array in arrays.items():
+                file.seek(start + table[name]["offset"])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(start + position)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return filename
+
+
+class _TileAtlas():
+    def __init__(self, filename, size=None, lines_per_segment=5, margin=0.2, tolerance=None):
+        """
+        Tile templates of one configuration read from an atlas file, the arrays are memory mapped read only
+        so all processes using the file share one copy of the geometry.
+        If size is given the header has to match that configuration, otherwise ValueError is raised.
+        """
+        self.filename = filename
+        self.data = np.memmap(filename, dtype=np.uint8, mode="r")
+        if bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Ungültiger Wert!")
+        length = int.from_bytes(bytes(self.data[len(MAGIC):len(MAGIC) + 8]), "little")
+        header = json.loads(bytes(self.data[len(MAGIC) + 8:len(MAGIC) + 8 + length]))
+        self.config = header["config"]
+        if header["hash"] != config_hash(self.config) or self.config["version"] != ATLAS_VERSION:
+            raise ValueError("Ungültiger Wert!")
+        if size is not None and self.config != atlas_config(size, lines_per_segment, margin, tolerance):
+            raise ValueError("Ungültiger Wert!")
+        self.hash = header["hash"]
+
+        start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+        for name, entry in header["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            count = math.prod(entry["shape"])
+            offset = start + entry["offset"]
+            setattr(self, name, self.data[offset:offset + count * dtype.itemsize].view(dtype).reshape(entry["shape"]))
+
+        self.number = {tuple(tuple(pair) for pair in connection): number for number, connection in enumerate(self.connections.tolist())}
+        self.templates = {}
+
+    def matches(self, size, lines_per_segment=5, margin=0.2, tolerance=None):
+        return self.config == atlas_config(size, lines_per_segment, margin, tolerance)
+
+    def template(self, connection):
+        """Template of the connection order, None if the atlas does not have it."""
+        key = tuple(tuple(pair) for pair in connection)
+        number = self.number.get(key)
+        if number is None:
+            return None
+        if number not in self.templates:
+            self.templates[number] = _AtlasTemplate(self, number)
+        return self.templates[number]
+
+    def polygon(self, index):
+        return shapely.from_wkb(bytes(self.wkb[self.wkb_offsets[index]:self.wkb_offsets[index + 1]]))
+
+
+class _AtlasTemplate():
+    def __init__(self, atlas, number):
+        """Tile template like _TileTemplate whose arrays are views into the atlas."""
+        self.atlas = atlas
+        self.number = number
+        self.connection = atlas.connections[number].tolist()
+        self.size = atlas.config["size"]
+        self.lines_per_segment = atlas.config["lines_per_segment"]
+        self.margin = atlas.config["margin"]
+        self.tolerance = atlas.config["tolerance"]
+        self.points = [(self.size * math.cos(i * math.pi / 3), self.size * math.sin(i * math.pi / 3)) for i in range(6)]
+        self.segments = [_AtlasSegment(self, 3 * number + position) for position in range(3)]
+
+    @cached_property
+    def polygon(self):
+        return Polygon(self.points)
+
+    @cached_property
+    def draw_area(self):
+        return self.atlas.polygon(7 * self.number + 6)
+
+
+class _AtlasSegment():
+    def __init__(self, template, number):
+        """Segment of an atlas template, number counts the segments of all templates in the atlas."""
+        self.template = template
+        self.atlas = template.atlas
+        self.number = number
+        self.connection = template.connection[number % 3]
+        self.size = template.size
+        self.lines_per_segment = template.lines_per_segment
+        self.margin = template.margin
+        self.tolerance = template.tolerance
+        self.controllpoint = 2
+        self.points = template.points
+
+    @cached_property
+    def lines(self):
+        atlas = self.atlas
+        first, last = atlas.segment_lines[self.number], atlas.segment_lines[self.number + 1]
+        offsets = atlas.line_offsets[first:last + 1]
+        return [atlas.coords[offsets[k]:offsets[k + 1]] for k in range(last - first)]
+
+    @cached_property
+    def piece_index(self):
+        atlas = self.atlas
+        return atlas.piece_index[atlas.segment_lines[self.number]:atlas.segment_lines[self.number + 1]].tolist()
+
+    @cached_property
+    def piece_ends(self):
+        atlas = self.atlas
+        ends = atlas.piece_ends[atlas.segment_lines[self.number]:atlas.segment_lines[self.number + 1]].tolist()
+        return [tuple(None if edge < 0 else (edge, position) for edge, position in (end[:2], end[2:])) for end in ends]
+
+    @cached_property
+    def controls(self):
+        atlas = self.atlas
+        return atlas.controls[atlas.segment_controls[self.number]:atlas.segment_controls[self.number + 1]]
+
+    @cached_property
+    def curves(self):
+        return piece_curves(self.controls, self.lines, self.piece_index)
+
+    @cached_property
+    def draw_area(self):
+        return self.atlas.polygon(7 * (self.number // 3) + 2 * (self.number % 3))
+
+    @cached_property
+    def erase_polygon(self):
+        return self.atlas.polygon(7 * (self.number // 3) + 2 * (self.number % 3) + 1)
+
+    @property
+    def simplify_tolerance(self):
+        return None if self.tolerance is None else self.tolerance / 2
+
+    def get_erase_polygon(self):
+        return self.erase_polygon
+
+    def get_lines(self):
+        return self.lines
+
+    def get_curves(self):
+        return self.curves
+
+
+def atlas_filename(directory, size, lines_per_segment=5, margin=0.2, tolerance=None):
+    """Path of the atlas of a configuration in directory, named by its config hash."""
+    return os.path.join(directory, f"tiles_{config_hash(atlas_config(size, lines_per_segment, margin, tolerance))[:16]}.atlas")
+
+
+def open_atlas(directory, size, lines_per_segment=5, margin=0.2, tolerance=None):
+    """Open the atlas of a configuration in directory, it is built first if it is missing, outdated or broken."""
+    filename = atlas_filename(directory, size, lines_per_segment, margin, tolerance)
+    if os.path.exists(filename):
+        try:
+            return _TileAtlas(filename, size, lines_per_segment, margin, tolerance)
+        except (ValueError, KeyError, json.JSONDecodeError):
+            pass
+    os.makedirs(directory, exist_ok=True)
+    build_atlas(filename, size, lines_per_segment, margin, tolerance)
+    return _TileAtlas(filename, size, lines_per_segment, margin, tolerance)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the tile atlas of one configuration.")
+    parser.add_argument("directory")
+    parser.add_argument("--hex_size", type=float, default=20)
+    parser.add_argument("--lines_per_segment", type=int, default=5)
+    parser.add_argument("--hexagon_margin", type=float, default=0.15)
+    parser.add_argument("--tolerance", type=float, default=None)
+    args = parser.parse_args()
+
+    atlas = open_atlas(args.directory, args.hex_size, args.lines_per_segment, args.hexagon_margin, args.tolerance)
+    print(f"{atlas.filename}: {len(atlas.number)} Kacheln, {os.path.getsize(atlas.filename) / 1e6:.1f} MB")
@@ -0,0 +1,96 @@
+import math
+from collections import OrderedDict
+from shapely.geometry import Polygon
+import numpy as np
+from Segment import _SegmentTemplate
+from Instrument import instrument
+
+
+class _TileTemplate:
+    def __init__(self, connection, size, lines_per_segment=5, margin=0.2, tolerance=None):
+        """
+        Geometry of one tile variant around the origin (0, 0).
+        Segments are drawn and erased in the order of connection, like in _Hexagon.
+        """
+        self.connection = connection
+        self.size = size
+        self.lines_per_segment = lines_per_segment
+        self.margin = margin
+        self.tolerance = tolerance
+        self.segments = []
+
+        self.points = [(size * math.cos(i * math.pi / 3), size * math.sin(i * math.pi / 3)) for i in range(6)]
+        self.polygon = Polygon(self.points)
+        self.draw_area = self.polygon
+
+        for connection in self.connection:
+            segment = _SegmentTemplate([0, 0], connection, 0, 0, self.size, self.draw_area, self.points, lines_per_segment=self.lines_per_segment, margin=self.margin, tolerance=self.tolerance)
+            with instrument.stage("erase"):
+                self.draw_area = self.draw_area.difference(segment.get_erase_polygon())
+            instrument.count("shapely_calls")
+            self.segments.append(segment)
+
+
+class _TileCache:
+    def __init__(self, maxsize=1024):
+        """
+        LRU cache of tile templates keyed by (connection order, size, lines_per_segment, margin, tolerance).
+        The connection order already encodes pattern and offset, so one configuration has at most 5*6*6 entries.
+        Templates missing in the cache are taken from an attached tile atlas (see TileAtlas.py) before they are built.
+        """
+        self.maxsize = maxsize
+        self.templates = OrderedDict()
+        self.atlases = []
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, connection, size, lines_per_segment=5, margin=0.2, tolerance=None):
+        """Return the template for the given parameters, building it on first use."""
+        key = (tuple(tuple(pair) for pair in connection), size, lines_per_segment, margin, tolerance)
+        template = self.templates.get(key)
+        if template is not None:
+            self.hits += 1
+            instrument.count("tile_cache_hits")
+            self.templates.move_to_end(key)
+            return template
+
+        self.misses += 1
+        instrument.count("tile_cache_misses")
+        template = self.from_atlas(connection, size, lines_per_segment, margin, tolerance)
+        if template is None:
+            with instrument.stage("tile_templates"):
+                template = _TileTemplate([list(pair) for pair in connection], size, lines_per_segment=lines_per_segment, margin=margin, tolerance=tolerance)
+        self.templates[key] = template
+        # Evict the least recently used templates
+        while len(self.templates) > self.maxsize:
+            self.templates.popitem(last=False)
+        return template
+
+    def attach(self, atlas):
+        """Use the templates of a _TileAtlas, templates already in the cache stay."""
+        if atlas not in self.atlases:
+            self.atlases.append(atlas)
+
+    def detach(self, atlas):
+        self.atlases.remove(atlas)
+
+    def from_atlas(self, connection, size, lines_per_segment, margin, tolerance):
+        for atlas in self.atlases:
+            if atlas.matches(size, lines_per_segment, margin, tolerance):
+                template = atlas.template(connection)
+                if template is not None:
+                    instrument.count("tile_atlas_hits")
+                    return template
+        return None
+
+    def clear(self):
+        self.templates.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.templates)
+
+
+# Shared cache for all hexagons of a process
+tile_cache = _TileCache()
@@ -0,0 +1,189 @@
+import os
+import json
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Grid import _Grid, COLORS
+from Colouring import _Colouring
+from DisjointSet import _DisjointSet
+from StrandGraph import _StrandGraph
+from Neighbours import neighbour_edge
+from SvgWriter import _SvgWriter
+
+
+def group_tile(grid_options, region, spill):
+    """
+    First pass over one tile: group its segments into local strands and clip its lines.
+    The clipped lines and the local strand of every line are written to the npz file spill for the second pass.
+    Returns compact arrays for stitching: conflicts (a, b, weight), open ends (id_x, id_y, edge, strand)
+    and the position (id_y, id_x, segment) of the first segment of every strand, and the bounds of the tile.
+    """
+    grid = _Grid(**grid_options, region=region)
+    colouring = _Colouring(grid.grid, mode=None)
+    groups = colouring.segment_group_list
+    strand_of = {group: position for position, group in enumerate(groups)}
+
+    graph = _StrandGraph.from_hexagon_ids([group.hexagon_ids for group in groups])
+    conflicts = [(a, b, weight) for a, neighbours in enumerate(graph.neighbours) for b, weight in neighbours.items() if a < b]
+    open_ends = [(id_x, id_y, edge, strand_of[colouring.group_of[segment]]) for id_x, id_y, edge, segment in colouring.open_edges]
+
+    # Strands are numbered in the order they first appear in the grid
+    first = []
+    for hexagon in grid.grid:
+        for position, segment in enumerate(hexagon.segments):
+            if strand_of[colouring.group_of[segment]] == len(first):
+                first.append((hexagon.id_y, hexagon.id_x, position))
+
+    lines = []
+    strands = []
+    for segment, pieces in grid.clip_segments():
+        lines.extend(pieces)
+        strands.extend([strand_of[colouring.group_of[segment]]] * len(pieces))
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(line) for line in lines])
+    coords = np.concatenate(lines) if lines else np.empty((0, 2))
+    np.savez(spill, coords=coords, offsets=offsets, strand=np.array(strands, dtype=np.int64))
+
+    # View box of the tile: its hexagons, limited to the draw area
+    bounds = None
+    if grid.grid:
+        hexagon_bounds = np.array([hexagon.bounds for hexagon in grid.grid])
+        min_x, min_y = np.maximum(hexagon_bounds[:, :2].min(axis=0), grid.draw_rect[:2])
+        max_x, max_y = np.minimum(hexagon_bounds[:, 2:].max(axis=0), grid.draw_rect[2:])
+        bounds = [float(min_x), float(min_y), float(max_x), float(max_y)]
+
+    return {
+        "strands": len(groups),
+        "conflicts": np.array(conflicts, dtype=np.int64).reshape(-1, 3),
+        "open_ends": np.array(open_ends, dtype=np.int64).reshape(-1, 4),
+        "first": np.array(first, dtype=np.int64).reshape(-1, 3),
+        "bounds": bounds,
+    }
+
+
+def draw_tile(spill, region, bounds, colours, filename, body, background=True):
+    """
+    Second pass over one tile: colour the lines from the spill of the first pass and write the body
+    fragment of the tile and the tile svg built from it. The spill is removed afterwards.
+    """
+    with np.load(spill) as data:
+        coords, offsets, strand = data["coords"], data["offsets"].tolist(), data["strand"]
+    os.remove(spill)
+    if bounds is None:
+        return None
+
+    lines = [coords[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+    line_colour = np.array(colours, dtype=np.int64)[strand] if len(strand) else strand
+    with _SvgWriter(body, 0, 0, fragment=True) as fragment:
+        for colour in np.unique(line_colour).tolist():
+            stroke = COLORS[colour] if colour < len(COLORS) else 'black'
+            fragment.write_lines([lines[k] for k in np.flatnonzero(line_colour == colour)], stroke=stroke, stroke_width=0.5)
+
+    min_x, min_y, max_x, max_y = bounds
+    width, height = max_x - min_x, max_y - min_y
+    with _SvgWriter(filename, width, height, size=(f"{width}mm", f"{height}mm"), background=background, min_x=min_x, min_y=min_y) as svg:
+        svg.write_fragment(body, fragment.count)
+
+    return {"file": os.path.basename(filename), "body": os.path.basename(body), "region": list(region), "bounds": bounds, "lines": svg.count}
+
+
+class _TiledRender():
+    def __init__(self, width, height, hex_size, seed, columns=2, rows=2, colour_count=5, mode="greedy", workers=None, **grid_options):
+        """
+        Render a large canvas as columns x rows tiles of whole hexagon rows and columns.
+        Every tile is generated and written on its own (in parallel), only the compact strand graph of the tiles
+        is stitched together so strands crossing tile borders keep one colour.
+        grid_options are passed to _Grid (offset_x, hexagon_margin, ...), a seed is needed so tiles are independent.
+        """
+        self.width = width
+        self.height = height
+        self.hex_size = hex_size
+        self.seed = seed
+        self.columns = columns
+        self.rows = rows
+        self.colour_count = colour_count
+        self.mode = mode
+        self.workers = workers
+        self.grid_options = dict(grid_options, width=width, height=height, hex_size=hex_size, seed=seed)
+
+    def regions(self):
+        """Id ranges (id_x_start, id_x_stop, id_y_start, id_y_stop) of the tiles."""
+        offset_x = self.grid_options.get("offset_x", 10)
+        offset_y = self.grid_options.get("offset_y", 0)
+        hex_r_y = self.hex_size * math.sqrt(3) / 2
+        hex_r_x = self.hex_size
+
+        # Same ranges as the loops in _Grid
+        id_y_count = len(np.arange(0 - offset_y, self.height + hex_r_y, hex_r_y))
+        id_x_count = max(len(np.arange(0 - offset_x + x_offset, self.width + hex_r_x, 3 * hex_r_x)) for x_offset in (0, 1.5 * hex_r_x))
+
+        x_bounds = np.linspace(0, id_x_count, self.columns + 1).round().astype(int)
+        y_bounds = np.linspace(0, id_y_count, self.rows + 1).round().astype(int)
+        return [(int(x_bounds[column]), int(x_bounds[column + 1]), int(y_bounds[row]), int(y_bounds[row + 1]))
+                for row in range(self.rows) for column in range(self.columns)]
+
+    def stitch(self, tiles):
+        """Join the local strands of all tiles across tile borders and colour the joined strands."""
+        start = np.cumsum([0] + [tile["strands"] for tile in tiles])
+        strands = _DisjointSet(int(start[-1]))
+
+        # Open ends of one tile meet open ends of the neighbouring tile
+        open_ends = {}
+        for position, tile in enumerate(tiles):
+            for id_x, id_y, edge, strand in tile["open_ends"].tolist():
+                open_ends[(id_x, id_y, edge)] = start[position] + strand
+        for (id_x, id_y, edge), strand in open_ends.items():
+            other = open_ends.get(neighbour_edge(id_x, id_y, edge))
+            if other is not None:
+                strands.union(int(strand), int(other))
+
+        # Joined strands in the order they first appear in the whole grid, like in _Colouring
+        first = {}
+        for position, tile in enumerate(tiles):
+            for strand, key in enumerate(map(tuple, tile["first"].tolist())):
+                root = strands.find(int(start[position] + strand))
+                first[root] = min(first.get(root, key), key)
+        roots = sorted(first, key=first.get)
+        number = {root: position for position, root in enumerate(roots)}
+
+        graph = _StrandGraph(len(roots))
+        for position, tile in enumerate(tiles):
+            for a, b, weight in tile["conflicts"].tolist():
+                graph.add_conflict(number[strands.find(int(start[position] + a))], number[strands.find(int(start[position] + b))], weight)
+        colours = graph.colour(self.colour_count, self.mode)
+
+        return [[colours[number[strands.find(int(start[position] + strand))]] for strand in range(tile["strands"])]
+                for position, tile in enumerate(tiles)]
+
+    def render(self, directory="tiles", assembled="hexagon_tiled.svg"):
+        """
+        Write one svg per tile and an index.json into directory, and if assembled is given
+        one svg of the whole canvas built from the body fragments of the tiles. Returns the index.
+        """
+        os.makedirs(directory, exist_ok=True)
+        regions = self.regions()
+        options = [self.grid_options] * len(regions)
+        spills = [os.path.join(directory, f"tile_{position}.npz") for position in range(len(regions))]
+        filenames = [os.path.join(directory, f"tile_{position}.svg") for position in range(len(regions))]
+        bodies = [os.path.join(directory, f"tile_{position}.body") for position in range(len(regions))]
+        background = [self.grid_options.get("background", True)] * len(regions)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            tiles = list(executor.map(group_tile, options, regions, spills))
+            colours = self.stitch(tiles)
+            written = list(executor.map(draw_tile, spills, regions, [tile["bounds"] for tile in tiles], colours, filenames, bodies, background))
+
+        index = {"width": self.width, "height": self.height, "hex_size": self.hex_size, "seed": self.seed,
+                 "tiles": [tile for tile in written if tile is not None]}
+        with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as file:
+            json.dump(index, file, indent=2)
+
+        if assembled:
+            self.assemble(directory, index, assembled)
+        return index
+
+    def assemble(self, directory, index, filename):
+        """Copy the body fragments of all tiles into one svg of the whole canvas, one tile at a time."""
+        with _SvgWriter(filename, self.width, self.height, size=(f"{self.width}mm", f"{self.height}mm"), background=self.grid_options.get("background", True)) as svg:
+            for tile in index["tiles"]:
+                svg.write_fragment(os.path.join(directory, tile["body"]), tile["lines"])